@@ -0,0 +1,40 @@
+"""
+Micro-benchmark of Email.extractAddress against the previous implementation.
+
+Run from the app directory: python benchmarks/bench_address.py
+"""
+
+import os
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fixtures import makeHeader
+from postalclient.main import Addressee, Email, cleanText
+
+
+def extractAddressOld(text):
+    """extractAddress as it was before the single pass parser"""
+    addresses = []
+    pattern = r'[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+'
+    for match in re.findall(pattern, text):
+        start = text.find(match)
+        end = start + len(match)
+        name = text[:start].strip(", \"")
+        addresses.append(Addressee(cleanText(name), match))
+        text = text[end:]
+    return addresses
+
+
+if __name__ == "__main__":
+    email = Email()
+    for count in (10, 100, 1000, 5000, 20000):
+        header = makeHeader(count)
+        assert [a.email for a in email.extractAddress(header)] == [a.email for a in extractAddressOld(header)]
+
+        number = max(1, 20000 // count)
+        old = timeit.timeit(lambda: extractAddressOld(header), number=number) / number
+        new = timeit.timeit(lambda: email.extractAddress(header), number=number) / number
+        print("{:>5} addresses: old {:9.3f} ms  new {:9.3f} ms  x{:.1f}".format(count, old * 1000, new * 1000, old / new))
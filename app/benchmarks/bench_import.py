@@ -0,0 +1,67 @@
+"""
+Startup cost of importing the package, measured with python -X importtime in fresh interpreters.
+
+Run from the app directory: python benchmarks/bench_import.py [--max-ms 30]
+Exits with status 1 when the median import time of postalclient.main exceeds --max-ms.
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+STATEMENTS = (
+    'import postalclient',
+    'import postalclient.main',
+    'from postalclient import PostalClient',
+    'from postalclient.main import Attachment; Attachment().extension()',
+)
+
+
+def importTimes(statement: str):
+    """Returns the total microseconds and the per module cumulative microseconds of one run"""
+    env = dict(os.environ, PYTHONPATH=APP_DIR)
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', statement], env=env,
+                            capture_output=True, text=True, check=True)
+    modules = {}
+    total = 0
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        modules[name.strip()] = int(cumulative)
+        if not name.startswith('  '):
+            # Top level imports, nested ones are included in their cumulative time
+            total += int(cumulative)
+    return total, modules
+
+
+def measure(statement: str, runs: int):
+    """Returns the median total milliseconds and the slowest modules of the median run"""
+    samples = sorted((importTimes(statement) for _ in range(runs)), key=lambda sample: sample[0])
+    total, modules = samples[len(samples) // 2]
+    slowest = sorted(modules.items(), key=lambda item: item[1], reverse=True)[:5]
+    return total / 1000, slowest
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=7)
+    parser.add_argument('--max-ms', type=float, default=None,
+                        help='fail when importing postalclient.main takes longer than this')
+    args = parser.parse_args()
+
+    subprocess.run([sys.executable, '-m', 'compileall', '-q', os.path.join(APP_DIR, 'postalclient')], check=True)
+    failed = False
+    for statement in STATEMENTS:
+        total, slowest = measure(statement, args.runs)
+        print("{:<66} {:8.2f} ms".format(statement, total))
+        for name, cumulative in slowest:
+            print("    {:<40} {:8.2f} ms".format(name, cumulative / 1000))
+        if args.max_ms is not None and statement == 'import postalclient.main' and total > args.max_ms:
+            failed = True
+    if failed:
+        print("postalclient.main import exceeded {} ms".format(args.max_ms))
+        sys.exit(1)
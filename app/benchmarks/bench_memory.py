@@ -0,0 +1,60 @@
+"""
+Memory used by parsed inbound messages held in memory: with dict backed classes as before __slots__,
+with __slots__, and with __slots__ and address interning.
+
+Run from the app directory: python benchmarks/bench_memory.py [count]
+"""
+
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fixtures import makeInbound
+from postalclient import main
+from postalclient.main import Addressee, Attachment, Email
+
+
+def withDict(cls):
+    """Copy of a __slots__ class keeping its attributes in a __dict__, the layout before __slots__"""
+    namespace = {name: value for name, value in vars(cls).items()
+                 if name not in cls.__slots__ and name not in ('__slots__', '__weakref__')}
+    return type(cls.__name__, (), namespace)
+
+
+DictAddressee = withDict(Addressee)
+DictAttachment = withDict(Attachment)
+DictEmail = withDict(Email)
+
+
+def measure(payloads, slots, intern):
+    main.INTERN_ADDRESSES = intern
+    if not slots:
+        # Methods of main create addresses and attachments through these globals
+        main.Addressee, main.Attachment = DictAddressee, DictAttachment
+    cls = Email if slots else DictEmail
+    try:
+        tracemalloc.start()
+        emails = []
+        for payload in payloads:
+            email = cls()
+            email.importEmail(payload)
+            emails.append(email)
+        used = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+    finally:
+        main.INTERN_ADDRESSES = False
+        main.Addressee, main.Attachment = Addressee, Attachment
+    return used
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    payloads = [makeInbound(i) for i in range(count)]
+    for label, slots, intern in (('dict, before __slots__', False, False),
+                                 ('__slots__', True, False),
+                                 ('__slots__ and interning', True, True)):
+        used = measure(payloads, slots, intern)
+        print("{:<24}: {:8.1f} MB per {} messages, {:6.0f} bytes per message".format(
+            label, used / 1e6, count, used / count))
@@ -0,0 +1,27 @@
+"""
+Size and build time of the JSON message API body against the raw MIME API body.
+
+Run from the app directory: python benchmarks/bench_raw.py
+"""
+
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fixtures import makeEmail
+from postalclient.client import rawPayload
+
+
+if __name__ == "__main__":
+    for size in (10 * 1024, 1024 * 1024, 10 * 1024 * 1024):
+        email = makeEmail(1, (size,))
+        number = max(1, 50 * 1024 * 1024 // (size * 5))
+        message = json.dumps(email.makeEmail()).encode('utf-8')
+        raw = rawPayload(email)
+        messageTime = timeit.timeit(lambda: json.dumps(email.makeEmail()).encode('utf-8'), number=number) / number
+        rawTime = timeit.timeit(lambda: rawPayload(email), number=number) / number
+        print("{:>6} KB attachment: message {:>9} bytes {:8.2f} ms   raw {:>9} bytes {:8.2f} ms".format(
+            size // 1024, len(message), messageTime * 1000, len(raw), rawTime * 1000))
@@ -0,0 +1,57 @@
+"""
+Requests per second of the WebhookReceiver ASGI app with synthetic delivery and inbound payloads.
+Requests are fed to the app directly, so the figures exclude the HTTP server.
+
+Run from the app directory: python benchmarks/bench_webhook.py [requests] [workers]
+"""
+
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fixtures import makeDelivery, makeInbound
+from postalclient.webhook import INBOUND, WebhookReceiver
+
+
+def makeBodies():
+    return makeDelivery().encode(), makeInbound(2, (256 * 1024,)).encode()
+
+
+async def request(app, body):
+    sent = []
+
+    async def receive():
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    async def send(message):
+        sent.append(message)
+
+    await app({"type": "http", "method": "POST", "headers": []}, receive, send)
+    return sent[0]["status"]
+
+
+async def run(count, workers):
+    app = WebhookReceiver(workers=workers, queue_size=count)
+    subjects = []
+    app.on("MessageSent")(lambda payload: payload["status"])
+    app.on(INBOUND)(lambda email: subjects.append(email.subject))
+
+    bodies = makeBodies()
+    start = time.perf_counter()
+    for i in range(count):
+        await request(app, bodies[i % 2])
+    acknowledged = time.perf_counter() - start
+    await app.stop()
+    handled = time.perf_counter() - start
+
+    print("{} requests, {} workers: acknowledged {:,.0f} req/s, handled {:,.0f} req/s ({} handled, {} failed)".format(
+        count, workers, count / acknowledged, count / handled, app.handled, app.failed))
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    asyncio.run(run(count, workers))
@@ -0,0 +1,80 @@
+"""
+Synthetic emails, headers and payloads shared by the benchmarks. Data is generated from a fixed seed,
+so every run measures the same input.
+"""
+
+import base64
+import json
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from postalclient.main import Addressee, Attachment, Email
+
+_random = random.Random(2024)
+
+
+def randomBytes(size: int):
+    return _random.getrandbits(size * 8).to_bytes(size, 'little') if size else b''
+
+
+def makeAttachment(size: int, kind: str = 'pdf'):
+    """Attachment holding size bytes of a PDF, PNG or unknown binary file"""
+    head = {'pdf': b'%PDF-1.4\n', 'png': b'\x89PNG\r\n\x1a\n', 'bin': b'\x00\x01\x02\x03'}[kind]
+    attachment = Attachment('file{}'.format(size))
+    attachment.data = base64.b64encode(head + randomBytes(max(size - len(head), 0))).decode('ascii')
+    return attachment
+
+
+def makeEmail(recipients: int = 1, attachments: tuple = (), cc: int = 0):
+    """Email to recipients addresses with one attachment per size in attachments"""
+    email = Email()
+    email.sender = Addressee('Sender', 'sender@example.com')
+    for i in range(recipients):
+        email.addReciever(Addressee('Person {}'.format(i), 'person{}@example.org'.format(i)))
+    for i in range(cc):
+        email.addCC(Addressee('Copy {}'.format(i), 'copy{}@example.net'.format(i)))
+    email.subject = 'Report'
+    email.plain_text = 'Please find the report attached.\n' * 20
+    email.html = '<p>Please find the report attached.</p>' * 20
+    for size in attachments:
+        email.attachments.append(makeAttachment(size))
+    return email
+
+
+def makeHeader(count: int):
+    """To header listing count quoted addresses"""
+    return ", ".join('"Person {0}" <person{0}@example.com>'.format(i) for i in range(count))
+
+
+def makeInbound(i: int = 0, attachments: tuple = ()):
+    """Postal inbound message payload, as posted to an HTTP route endpoint"""
+    return json.dumps({
+        "id": i,
+        "rcpt_to": "support@example.com",
+        "mail_from": "billing@shop.example.com",
+        "from": "Billing <billing@shop.example.com>",
+        "to": "Support <support@example.com>, Person {0} <person{0}@example.org>".format(i % 500),
+        "cc": None,
+        "date": "Mon, 1 Jan 2024 10:00:00 +0000",
+        "subject": "Invoice {}".format(i),
+        "plain_body": "Hello",
+        "html_body": None,
+        "attachment_quantity": len(attachments),
+        "attachments": [{"filename": "scan{}.pdf".format(n), "content_type": "application/pdf",
+                         "data": base64.b64encode(b'%PDF-1.4\n' + randomBytes(size)).decode('ascii')}
+                        for n, size in enumerate(attachments)],
+    })
+
+
+def makeDelivery():
+    """Postal MessageSent webhook body"""
+    return json.dumps({
+        "event": "MessageSent",
+        "timestamp": 1700000000.0,
+        "uuid": "0b0f6a1e-3c1b-4f1e-9a5b-0f2c7a9d1e11",
+        "payload": {"message": {"id": 1, "token": "abc", "to": "person@example.com"},
+                    "status": "Sent", "details": "Message sent", "time": 0.2},
+    })
@@ -0,0 +1,80 @@
+"""
+Local stand-in for a Postal server, answering the send and message APIs over HTTP/1.1 keep-alive.
+"""
+
+import json
+import threading
+import time
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Buffer the response so headers and body go out in one write, avoiding Nagle delays
+    wbufsize = -1
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        with self.server.lock:
+            number = self.server.received = self.server.received + 1
+        if self.server.delay:
+            time.sleep(self.server.delay)
+        if self.server.fail > 0:
+            self.server.fail -= 1
+            self.reply(503, {"status": "error", "data": {"code": "Unavailable", "message": "Try again later"}})
+            return
+
+        if self.path.endswith('/send/message'):
+            request = json.loads(body)
+            data = {"message_id": "message-{}".format(number),
+                    "messages": {address: {"id": number, "token": "token"} for address in request.get('to', [])}}
+        elif self.path.endswith('/send/raw'):
+            data = {"message_id": "raw-{}".format(number), "messages": {}}
+        elif self.path.endswith('/messages/message'):
+            data = {"id": json.loads(body)["id"], "status": {"status": "Sent"}}
+        else:
+            self.send_error(404)
+            return
+
+        self.reply(200, {"status": "success", "time": 0.0, "flags": {}, "data": data})
+
+    def reply(self, status: int, result: dict):
+        content = json.dumps(result).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+        self.wfile.flush()
+
+
+class StubServer(ThreadingHTTPServer):
+    """Stub Postal server on a free local port, served from a daemon thread"""
+    daemon_threads = True
+    fail: int = 0
+    """Number of following requests answered with 503"""
+    delay: float = 0
+    """Seconds to wait before answering, to make clients time out"""
+    received: int
+    """Number of requests received"""
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _Handler)
+        self.lock = threading.Lock()
+        self.received = 0
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    @property
+    def url(self):
+        return "http://127.0.0.1:{}".format(self.server_port)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,266 @@
+"""
+Benchmark suite for the build, parse and send hot paths, reporting throughput and peak memory.
+
+Run from the app directory:
+    python benchmarks/suite.py                          run every case
+    python benchmarks/suite.py -k makeEmail --quick     run matching cases with fewer repeats
+    python benchmarks/suite.py --save                   store the results as the baseline
+    python benchmarks/suite.py --compare --max-regression 25
+                                                        exit 1 when a case is 25% slower than the baseline
+
+Each case is timed with timeit in the best of several repeats. Peak memory is the largest amount of
+Python memory allocated during one call, traced separately with tracemalloc.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import sys
+import timeit
+import tracemalloc
+
+import fixtures
+
+from postalclient.client import AsyncPostalClient, PostalClient
+from postalclient.main import Attachment, Email, LazyEmail
+from stub import StubServer
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+"""Stored results that runs are compared against"""
+
+CASES = []
+"""Registered (name, setup) pairs, in report order"""
+
+KB = 1024
+MB = 1024 * 1024
+
+
+def benchmark(name: str):
+    """Registers a case. The decorated function prepares its data and returns (run, items, bytes):
+    the function to time and the number of items and bytes it processes per call. bytes is 0 for
+    calls that only reference the data, such as makeEmail sharing the attachment strings"""
+    def register(setup):
+        CASES.append((name, setup))
+        return setup
+    return register
+
+
+def _server():
+    """Stub Postal server shared by the end to end cases, started on first use"""
+    global _stub
+    if _stub is None:
+        _stub = StubServer()
+    return _stub
+
+
+_stub = None
+
+
+def _sizes(sizes: tuple):
+    """Label for a list of attachment sizes"""
+    if not sizes:
+        return "no attachments"
+    return "+".join("{}{}".format(size // MB, "MB") if size >= MB else "{}KB".format(size // KB) for size in sizes)
+
+
+for recipients, sizes in ((1, ()), (50, (10 * KB,) * 3), (500, (1 * MB, 4 * MB))):
+    def makeEmailCase(recipients=recipients, sizes=sizes):
+        email = fixtures.makeEmail(recipients, sizes)
+        email.makeEmail()
+        return email.makeEmail, 1, 0
+
+    def jsonCase(recipients=recipients, sizes=sizes):
+        email = fixtures.makeEmail(recipients, sizes)
+        body = email.to_json_bytes()
+        return email.to_json_bytes, 1, len(body)
+
+    label = "{} rcpt, {}".format(recipients, _sizes(sizes))
+    benchmark("makeEmail[{}]".format(label))(makeEmailCase)
+    benchmark("to_json_bytes[{}]".format(label))(jsonCase)
+
+
+for kind, size in (('pdf', 10 * KB), ('pdf', 4 * MB), ('bin', 10 * KB)):
+    def sendFormatCase(kind=kind, size=size):
+        data = fixtures.makeAttachment(size, kind).data
+
+        def run():
+            attachment = Attachment('file')
+            attachment.data = data
+            return attachment.sendFormat()
+        return run, 1, 0
+
+    benchmark("Attachment.sendFormat[{} {}KB]".format(kind, size // KB))(sendFormatCase)
+
+
+for count in (10, 1000, 20000):
+    def addressCase(count=count):
+        header = fixtures.makeHeader(count)
+        email = Email()
+        return lambda: email.extractAddress(header), count, len(header)
+
+    benchmark("extractAddress[{} addresses]".format(count))(addressCase)
+
+
+for sizes in ((), (5 * MB,)):
+    label = _sizes(sizes)
+
+    def importCase(sizes=sizes):
+        payload = fixtures.makeInbound(1, sizes)
+
+        def run():
+            email = Email()
+            email.importEmail(payload)
+            return email
+        return run, 1, len(payload)
+
+    def lazyCase(sizes=sizes):
+        payload = fixtures.makeInbound(1, sizes)
+
+        def run():
+            email = LazyEmail()
+            email.importEmail(payload)
+            return email
+        return run, 1, len(payload)
+
+    benchmark("importEmail[{}]".format(label))(importCase)
+    benchmark("LazyEmail.importEmail[{}]".format(label))(lazyCase)
+
+
+for sizes in ((), (1 * MB, 4 * MB)):
+    def readCase(sizes=sizes):
+        data = fixtures.makeEmail(50, sizes, cc=10).makeEmail()
+
+        def run():
+            email = Email()
+            email.readSendFormat(data)
+            return email
+        return run, 1, 0
+
+    def storeCase(sizes=sizes):
+        stored = fixtures.makeEmail(50, sizes, cc=10).to_store()
+        return lambda: Email.from_store(stored), 1, 0
+
+    label = _sizes(sizes)
+    benchmark("readSendFormat[{}]".format(label))(readCase)
+    benchmark("from_store[{}]".format(label))(storeCase)
+
+
+@benchmark("send[100 x 10KB, 1 connection]")
+def sendCase():
+    email = fixtures.makeEmail(3, (10 * KB,))
+    client = PostalClient(_server().url, "key", pool_size=1)
+
+    def run():
+        for _ in range(100):
+            client.send(email)
+    return run, 100, 100 * len(email.to_json_bytes())
+
+
+@benchmark("send_many[200 x 10KB, concurrency 8]")
+def sendManyCase():
+    email = fixtures.makeEmail(3, (10 * KB,))
+    client = AsyncPostalClient(_server().url, "key", pool_size=8)
+
+    async def sendAll():
+        async for result in client.send_many([email] * 200, concurrency=8):
+            if not result.ok:
+                raise result.error
+
+    return lambda: asyncio.run(sendAll()), 200, 200 * len(email.to_json_bytes())
+
+
+def measure(run, repeat: int, min_time: float):
+    """Returns the best seconds per call, and the peak bytes allocated by one call"""
+    run()
+    timer = timeit.Timer(run)
+    number = 1
+    while True:
+        elapsed = timer.timeit(number)
+        if elapsed >= min_time:
+            break
+        number = max(number * 2, int(number * min_time / max(elapsed, 1e-9)))
+    seconds = min([elapsed] + timer.repeat(repeat - 1, number)) / number
+
+    tracemalloc.start()
+    start = tracemalloc.get_traced_memory()[0]
+    result = run()
+    peak = tracemalloc.get_traced_memory()[1] - start
+    del result
+    tracemalloc.stop()
+    return seconds, peak
+
+
+def formatRate(value: float, unit: str):
+    for scale, prefix in ((1e9, 'G'), (1e6, 'M'), (1e3, 'k')):
+        if value >= scale:
+            return "{:7.2f} {}{}".format(value / scale, prefix, unit)
+    return "{:7.2f} {}".format(value, unit)
+
+
+def loadBaseline(path: str):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f).get('results', {})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('-k', dest='filter', help='only run cases whose name contains this text')
+    parser.add_argument('--quick', action='store_true', help='fewer and shorter repeats')
+    parser.add_argument('--save', action='store_true', help='store the results as the baseline')
+    parser.add_argument('--compare', action='store_true', help='compare with the baseline')
+    parser.add_argument('--baseline', default=BASELINE, help='baseline file, default %(default)s')
+    parser.add_argument('--max-regression', type=float, default=None,
+                        help='with --compare, fail when a case is this many percent slower')
+    args = parser.parse_args()
+
+    repeat, min_time = (3, 0.05) if args.quick else (5, 0.2)
+    baseline = loadBaseline(args.baseline) if args.compare else {}
+    results = {}
+    regressions = []
+
+    print("{:<48} {:>12} {:>14} {:>13} {:>11}".format('case', 'per call', 'items/s', 'throughput', 'peak mem'))
+    for name, setup in CASES:
+        if args.filter and args.filter not in name:
+            continue
+        run, items, size = setup()
+        seconds, peak = measure(run, repeat, min_time)
+        results[name] = {'seconds': seconds, 'items_per_second': items / seconds,
+                         'bytes_per_second': size / seconds, 'peak_bytes': peak}
+
+        line = "{:<48} {:>9.3f} ms {:>14} {:>13} {:>8.1f} MB".format(
+            name, seconds * 1000, formatRate(items / seconds, '/s'),
+            formatRate(size / seconds, 'B/s') if size else '', peak / MB)
+        if name in baseline:
+            change = (seconds / baseline[name]['seconds'] - 1) * 100
+            line += "  {:+6.1f}%".format(change)
+            if args.max_regression is not None and change > args.max_regression:
+                regressions.append(name)
+        print(line)
+
+    if _stub is not None:
+        _stub.shutdown()
+
+    if args.save:
+        stored = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                stored = json.load(f).get('results', {})
+        stored.update(results)
+        with open(args.baseline, 'w') as f:
+            json.dump({'python': platform.python_version(), 'machine': platform.machine(),
+                       'processor': platform.processor() or platform.machine(), 'results': stored},
+                      f, indent=2, sort_keys=True)
+            f.write('\n')
+        print("Saved {} results to {}".format(len(results), args.baseline))
+
+    if regressions:
+        print("Slower than the baseline by more than {}%: {}".format(args.max_regression, ", ".join(regressions)))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1 +1,29 @@
-from main import Addressee, Attachment, Email
+import importlib
+
+_EXPORTS = {
+    'main': ('Addressee', 'Attachment', 'AttachmentStore', 'Email', 'EmailTemplate', 'LazyEmail',
+             'build_payloads', 'iter_eml_directory'),
+    'client': ('AsyncPostalClient', 'PostalClient', 'PostalError', 'SendResult', 'TTLCache'),
+    'outbox': ('Outbox',),
+    'webhook': ('INBOUND', 'WebhookReceiver'),
+    'ratelimit': ('RateLimiter', 'TokenBucket'),
+    'metrics': ('Histogram', 'OpenTelemetryHook', 'PrometheusHook', 'addHook', 'removeHook'),
+    'columns': ('load_columns',),
+}
+"""Public names by submodule. Submodules are imported on first access, so importing the package stays cheap"""
+
+_MODULES = {name: module for module, names in _EXPORTS.items() for name in names}
+
+__all__ = sorted(_MODULES)
+
+
+def __getattr__(name):
+    if name not in _MODULES:
+        raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+    value = getattr(importlib.import_module('.' + _MODULES[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_MODULES))
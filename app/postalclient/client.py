@@ -0,0 +1,408 @@
+"""
+HTTP transport for sending emails to a Postal server.
+"""
+
+import base64
+import http.client
+import json
+import queue
+import select
+import threading
+import time
+
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from urllib.parse import urlsplit
+
+
+NOT_SENT = "NotSent"
+"""PostalError code of a request that failed before it was written, so Postal did not receive it"""
+
+NO_RESPONSE = "NoResponse"
+"""PostalError code of a request that was written but not answered. Postal may have accepted it"""
+
+
+class PostalError(Exception):
+    """Raised when Postal rejects a request or it can not be completed"""
+    code: str
+    """Postal error code, the HTTP status when no code was returned, or NOT_SENT or NO_RESPONSE"""
+    status: int
+    """HTTP status of the last response, None if no response was received"""
+
+    def __init__(self, message: str, code: str = None, status: int = None):
+        super().__init__(message)
+        self.code = code
+        self.status = status
+
+
+class PostalClient:
+    """Client for the Postal API, keeping a pool of keep-alive connections to the server"""
+    url: str
+    """Base URL of the Postal server, eg https://postal.example.com"""
+    key: str
+    """Server API key"""
+    pool_size: int
+    """Maximum number of idle connections kept open"""
+    timeout: float
+    """Socket timeout in seconds for connecting and reading"""
+    retries: int
+    """Number of retries on 429, 5xx and connection errors before the request is written"""
+    backoff: float
+    """Base delay in seconds between retries, doubled on every attempt"""
+    cache: "TTLCache"
+    """Cache of message details fetched with message and message_statuses"""
+    limiter: object
+    """RateLimiter every request waits for, None to send without limits"""
+
+    RETRY_STATUS = (429, 500, 502, 503, 504)
+
+    def __init__(self, url: str, key: str, pool_size: int = 10, timeout: float = 30,
+                 retries: int = 3, backoff: float = 0.5, cache_size: int = 4096, cache_ttl: float = 60,
+                 limiter=None):
+        """Make a client. Requires the server url and API key"""
+        parts = urlsplit(url if "://" in url else "https://" + url)
+        if parts.scheme == "https":
+            self._connection_class = http.client.HTTPSConnection
+        elif parts.scheme == "http":
+            self._connection_class = http.client.HTTPConnection
+        else:
+            raise ValueError("Unsupported scheme {}".format(parts.scheme))
+
+        self.url = url
+        self.key = key
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self._host = parts.hostname
+        self._port = parts.port
+        self._prefix = parts.path.rstrip("/")
+        self._pool = queue.LifoQueue(maxsize=pool_size)
+        self.cache = TTLCache(cache_size, cache_ttl)
+        self.limiter = limiter
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _getConnection(self):
+        """Take an idle connection from the pool, or open a new one.
+        A pooled connection the server has closed meanwhile is reconnected before it is used"""
+        try:
+            connection = self._pool.get_nowait()
+        except queue.Empty:
+            return self._connection_class(self._host, self._port, timeout=self.timeout)
+        if connection.sock is not None and _isClosed(connection.sock):
+            connection.close()
+        return connection
+
+    def _putConnection(self, connection):
+        """Return a connection to the pool, closing it if the pool is full"""
+        try:
+            self._pool.put_nowait(connection)
+        except queue.Full:
+            connection.close()
+
+    def _retryDelay(self, attempt: int, retry_after: str = None):
+        if retry_after:
+            try:
+                return float(retry_after)
+            except ValueError:
+                pass
+        return self.backoff * (2 ** attempt)
+
+    def request(self, path: str, payload, domains=()):
+        """POST a JSON payload to an API path and return the data of the response.
+        payload is a dict, or bytes already encoded as JSON. domains are the recipient domains for the limiter.
+        Failures before the request is written, 429 and 5xx are retried. A request that was written but
+        not answered is never sent again, it raises PostalError with the NO_RESPONSE code."""
+        if isinstance(payload, (bytes, bytearray)):
+            body = payload
+        else:
+            body = json.dumps(payload).encode("utf-8")
+        headers = {
+            "Content-Type": "application/json",
+            "Accept": "application/json",
+            "X-Server-API-Key": self.key,
+        }
+
+        attempt = 0
+        while True:
+            started = self.limiter.acquire(domains) if self.limiter else None
+            connection = self._getConnection()
+            reused = connection.sock is not None
+            try:
+                connection.request("POST", self._prefix + path, body=body, headers=headers)
+            except (http.client.HTTPException, OSError) as e:
+                # The body was not fully written, so Postal can not have processed the request
+                self._abort(connection, started)
+                if attempt >= self.retries:
+                    raise PostalError(str(e), NOT_SENT) from e
+                if not reused:
+                    time.sleep(self._retryDelay(attempt))
+                attempt += 1
+                continue
+
+            try:
+                response = connection.getresponse()
+                content = response.read()
+            except (http.client.HTTPException, OSError) as e:
+                # Sent but not answered, such as a read timeout or a reset. Postal may have processed the
+                # request, so sending it again could deliver twice
+                self._abort(connection, started)
+                raise PostalError(str(e), NO_RESPONSE) from e
+
+            if self.limiter:
+                self.limiter.release(started, response.status)
+            if response.will_close:
+                connection.close()
+            else:
+                self._putConnection(connection)
+
+            if response.status in self.RETRY_STATUS and attempt < self.retries:
+                time.sleep(self._retryDelay(attempt, response.getheader("Retry-After")))
+                attempt += 1
+                continue
+
+            return self._readResponse(response.status, content)
+
+    def _abort(self, connection, started):
+        if self.limiter:
+            self.limiter.release(started)
+        connection.close()
+
+    def _readResponse(self, status: int, content: bytes):
+        try:
+            result = json.loads(content)
+        except ValueError:
+            raise PostalError("Invalid response from server (HTTP {})".format(status), str(status), status)
+        if not isinstance(result, dict):
+            raise PostalError("Invalid response from server (HTTP {})".format(status), str(status), status)
+
+        data = result.get("data") or {}
+        if status >= 400 or result.get("status") != "success":
+            if not isinstance(data, dict):
+                data = {}
+            raise PostalError(data.get("message", "Request failed (HTTP {})".format(status)),
+                              data.get("code", str(status)), status)
+        return data
+
+    def send(self, email):
+        """Send an Email, returning the Postal response data with message_id and messages"""
+        domains = {address.rpartition("@")[2] for address in email.recipientSet()} if self.limiter else ()
+        return self.request("/api/v1/send/message", email.to_json_bytes(), domains)
+
+    def send_raw(self, email, mail_from: str = None, rcpt_to: list = None, bounce: bool = False):
+        """Send an Email as a MIME message built by Email.to_mime_bytes through the raw API.
+        mail_from and rcpt_to default to the sender and all to, cc and bcc addresses."""
+        return self.request("/api/v1/send/raw", rawPayload(email, mail_from, rcpt_to, bounce))
+
+    def message(self, id: int, expansions: tuple = ("status",)):
+        """Returns the details of a sent message, such as its status, from the cache or the API"""
+        data = self.cache.get((id, tuple(expansions)))
+        if data is None:
+            data = self._fetchMessage(id, expansions)
+        return data
+
+    def _fetchMessage(self, id: int, expansions: tuple):
+        data = self.request("/api/v1/messages/message", {"id": id, "_expansions": list(expansions)})
+        self.cache.set((id, tuple(expansions)), data)
+        return data
+
+    def deliveries(self, id: int):
+        """Returns the delivery attempts of a sent message, from the cache or the API"""
+        key = (id, "deliveries")
+        data = self.cache.get(key)
+        if data is None:
+            data = self.request("/api/v1/messages/deliveries", {"id": id})
+            self.cache.set(key, data)
+        return data
+
+    def message_statuses(self, ids, expansions: tuple = ("status",), concurrency: int = None):
+        """Fetches the details of many messages, with at most concurrency requests in flight.
+        Cached messages are not requested again. Returns a dict of id to data, or PostalError on failure"""
+        results = {}
+        missing = []
+        for id in dict.fromkeys(ids):
+            data = self.cache.get((id, tuple(expansions)))
+            if data is None:
+                missing.append(id)
+            else:
+                results[id] = data
+
+        def fetch(id):
+            try:
+                return self._fetchMessage(id, expansions)
+            except PostalError as e:
+                return e
+
+        if missing:
+            with ThreadPoolExecutor(max_workers=min(concurrency or self.pool_size, len(missing))) as executor:
+                results.update(zip(missing, executor.map(fetch, missing)))
+        return results
+
+    def close(self):
+        """Close all idle connections"""
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+class TTLCache:
+    """Thread safe LRU cache whose entries expire after ttl seconds"""
+    maxsize: int
+    """Maximum number of entries, the least recently used is dropped first"""
+    ttl: float
+    """Seconds an entry stays valid"""
+    hits: int
+    """Number of lookups answered from the cache"""
+    misses: int
+    """Number of lookups not found or expired"""
+
+    def __init__(self, maxsize: int = 4096, ttl: float = 60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """Returns the cached value, or None if missing or expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Returns hits, misses and the current size"""
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._entries)}
+
+
+def _isClosed(sock):
+    """True when an idle socket is readable, which means the server closed it or sent data out of turn"""
+    try:
+        return bool(select.select([sock], [], [], 0)[0])
+    except (OSError, ValueError):
+        return True
+
+
+def rawPayload(email, mail_from: str = None, rcpt_to: list = None, bounce: bool = False):
+    """Returns the JSON body for the raw API as bytes, splicing in the base64 message without re-escaping"""
+    if mail_from is None:
+        mail_from = email.sender.email
+    if rcpt_to is None:
+        rcpt_to = [person.email for people in email.uniqueRecipients() for person in people]
+
+    head = json.dumps({"mail_from": mail_from, "rcpt_to": rcpt_to, "bounce": bounce})
+    return b"".join((head[:-1].encode("utf-8"), b', "data": "',
+                     base64.b64encode(email.to_mime_bytes()), b'"}'))
+
+
+class SendResult:
+    """Outcome of sending a single Email"""
+    email: object
+    """The Email that was sent"""
+    data: dict
+    """Postal response data, None if sending failed"""
+    error: Exception
+    """The error raised while sending, None if it succeeded"""
+
+    def __init__(self, email, data: dict = None, error: Exception = None):
+        self.email = email
+        self.data = data
+        self.error = error
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    @property
+    def message_id(self):
+        """Postal message ID of the sent email"""
+        return self.data.get("message_id") if self.data else None
+
+
+class AsyncPostalClient:
+    """asyncio client for the Postal API, running requests on a shared PostalClient connection pool"""
+    client: PostalClient
+    """The underlying pooled client"""
+
+    def __init__(self, url: str, key: str, pool_size: int = 10, **kwargs):
+        """Make a client. Takes the same arguments as PostalClient"""
+        self.client = PostalClient(url, key, pool_size=pool_size, **kwargs)
+        self._executor = ThreadPoolExecutor(max_workers=pool_size)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self.close()
+
+    async def send(self, email):
+        """Send an Email, returning the Postal response data"""
+        import asyncio
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self.client.send, email)
+
+    async def _sendResult(self, email, semaphore: "asyncio.Semaphore"):
+        try:
+            return SendResult(email, await self.send(email))
+        except Exception as e:
+            return SendResult(email, error=e)
+        finally:
+            semaphore.release()
+
+    async def send_many(self, emails, concurrency: int = 10):
+        """Send many Emails with at most concurrency requests in flight.
+        Yields a SendResult for every email as soon as it finishes, in completion order."""
+        import asyncio
+
+        semaphore = asyncio.Semaphore(concurrency)
+        pending = set()
+
+        for email in emails:
+            if semaphore.locked():
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    yield task.result()
+            await semaphore.acquire()
+            pending.add(asyncio.ensure_future(self._sendResult(email, semaphore)))
+
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                yield task.result()
+
+    def close(self):
+        """Close the connection pool and worker threads"""
+        self._executor.shutdown(wait=False)
+        self.client.close()
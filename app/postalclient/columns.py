@@ -0,0 +1,190 @@
+"""
+Bulk loading of Postal message payloads into columns, for analytics over large exports.
+"""
+
+import collections
+import hashlib
+import json
+import os
+
+from concurrent.futures import ProcessPoolExecutor
+
+from .main import _scanObject, parseAddresses
+
+COLUMNS = ('id', 'message_id', 'date', 'from_name', 'from_email', 'to', 'cc', 'subject', 'tag',
+           'attachment_quantity')
+"""Columns read from every payload. to and cc hold lists of addresses"""
+
+SKIPPED_KEYS = ('plain_body', 'html_body', 'attachments', 'raw_message')
+"""Large keys that are skipped over without being decoded"""
+
+SCAN_SIZE = 16384
+"""Payloads longer than this are scanned so SKIPPED_KEYS are not decoded, shorter ones are parsed with json"""
+
+
+def load_columns(source, workers: int=None, chunk_size: int=10000, hash_attachments: bool=False,
+                 output: str=None):
+    """Loads Postal message payloads into columns, without building Email objects.
+    source is a JSONL file path, or an iterable of JSON strings, bytes or dicts. Payloads are parsed in
+    chunks of chunk_size across a process pool of workers, in a single process when workers is 0.
+    With hash_attachments an attachment_digests column holds the AttachmentStore digest of every attachment.
+    Returns a dict of column lists, or a pyarrow Table, pandas DataFrame or dict of NumPy arrays
+    when output is 'arrow', 'pandas' or 'numpy'."""
+    if isinstance(source, (str, os.PathLike)):
+        jobs = [(os.fspath(source), start, end, hash_attachments)
+                for start, end in _fileRanges(source, chunk_size)]
+        parse = _parseRange
+    else:
+        jobs = ((chunk, hash_attachments) for chunk in _chunks(source, chunk_size))
+        parse = _parseChunk
+
+    columns = _emptyColumns(hash_attachments)
+    if workers == 0:
+        _extend(columns, map(parse, jobs))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            _extend(columns, _mapBounded(executor, parse, jobs, 2 * (workers or os.cpu_count() or 1)))
+    return _convert(columns, output)
+
+
+def _mapBounded(executor, function, jobs, window: int):
+    """Like executor.map, in order, but submitting at most window jobs ahead so iterables are read lazily"""
+    pending = collections.deque()
+    for job in jobs:
+        pending.append(executor.submit(function, job))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def _emptyColumns(hash_attachments: bool):
+    names = COLUMNS + ('attachment_digests',) if hash_attachments else COLUMNS
+    return {name: [] for name in names}
+
+
+def _extend(columns: dict, results):
+    for result in results:
+        for name, values in result.items():
+            columns[name].extend(values)
+
+
+def _chunks(source, chunk_size: int):
+    chunk = []
+    for payload in source:
+        chunk.append(payload)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _fileRanges(path, chunk_size: int, line_size: int=2048):
+    """Splits a JSONL file into byte ranges of about chunk_size lines, cut at line ends"""
+    size = os.path.getsize(path)
+    step = max(chunk_size * line_size, 1 << 20)
+    ranges = []
+    with open(path, 'rb') as f:
+        start = 0
+        while start < size:
+            f.seek(min(start + step, size))
+            f.readline()
+            end = min(f.tell(), size)
+            ranges.append((start, end))
+            start = end
+    return ranges
+
+
+def _parseRange(job):
+    path, start, end, hash_attachments = job
+    with open(path, 'rb') as f:
+        f.seek(start)
+        lines = f.read(end - start).splitlines()
+    return _parseChunk(([line for line in lines if line.strip()], hash_attachments))
+
+
+def _parseChunk(job):
+    """Process pool worker turning a list of payloads into a dict of column lists"""
+    payloads, hash_attachments = job
+    columns = _emptyColumns(hash_attachments)
+    ids, message_ids, dates = columns['id'], columns['message_id'], columns['date']
+    from_names, from_emails = columns['from_name'], columns['from_email']
+    tos, ccs, subjects, tags = columns['to'], columns['cc'], columns['subject'], columns['tag']
+    quantities = columns['attachment_quantity']
+    senders = {}
+
+    for payload in payloads:
+        attachments = None
+        if isinstance(payload, dict):
+            data = payload
+            attachments = data.get('attachments')
+        else:
+            if isinstance(payload, (bytes, bytearray)):
+                payload = payload.decode('utf-8')
+            if len(payload) < SCAN_SIZE:
+                data = json.loads(payload)
+                attachments = data.get('attachments')
+            else:
+                data, spans = _scanObject(payload, SKIPPED_KEYS)
+                if hash_attachments and 'attachments' in spans:
+                    start, end = spans['attachments']
+                    attachments = json.loads(payload[start:end])
+
+        ids.append(data.get('id'))
+        message_ids.append(data.get('message_id'))
+        dates.append(data.get('date'))
+        sender = data.get('from')
+        people = senders.get(sender)
+        if people is None:
+            people = senders[sender] = _sender(sender)
+        from_names.append(people[0])
+        from_emails.append(people[1])
+        tos.append(_addresses(data.get('to')))
+        ccs.append(_addresses(data.get('cc')))
+        subjects.append(data.get('subject'))
+        tags.append(data.get('tag'))
+        quantities.append(data.get('attachment_quantity', len(attachments) if attachments is not None else 0))
+
+        if hash_attachments:
+            columns['attachment_digests'].append(
+                [hashlib.sha256(attachment['data'].replace('\n', '').encode('ascii')).hexdigest()
+                 for attachment in attachments or ()])
+    return columns
+
+
+def _sender(value):
+    """Name and address of a from field"""
+    people = parseAddresses(value) if value else ()
+    if not people:
+        return None, None
+    return people[0].name, people[0].email
+
+
+def _addresses(value):
+    """Addresses of a to or cc field, given as a header string or a list"""
+    if not value:
+        return []
+    if not isinstance(value, str):
+        value = ', '.join(value)
+    return [person.email for person in parseAddresses(value)]
+
+
+def _convert(columns: dict, output: str):
+    if output is None:
+        return columns
+    if output == 'arrow':
+        import pyarrow
+
+        return pyarrow.table(columns)
+    if output == 'pandas':
+        import pandas
+
+        return pandas.DataFrame(columns)
+    if output == 'numpy':
+        import numpy
+
+        return {name: numpy.asarray(values, dtype=numpy.int64) if name == 'attachment_quantity'
+                else numpy.fromiter(values, dtype=object, count=len(values))
+                for name, values in columns.items()}
+    raise ValueError("Unknown output {}".format(output))
@@ -3,18 +3,126 @@ A Wrapper for the Postal REST API.
 """
 
 import base64
-import email
-import mimetypes
-import magic
+import codecs
+import collections
+import copy
+import glob
+import importlib
+import io
 import json
+import mmap
+import os
+import struct
+import sys
 
 import re
 
-from email.utils import parseaddr
+
+class _LazyModule:
+    """Stands in for a module global until its first use, then imports the module and replaces itself.
+    Keeps libmagic and other slow imports out of the startup of processes that never use them."""
+
+    def __init__(self, name: str, *submodules: str):
+        self._name = name
+        self._submodules = submodules
+
+    def __getattr__(self, attr):
+        for submodule in self._submodules:
+            importlib.import_module(submodule)
+        module = importlib.import_module(self._name)
+        globals()[self._name.rpartition('.')[2]] = module
+        return getattr(module, attr)
+
+
+magic = _LazyModule('magic')
+mimetypes = _LazyModule('mimetypes')
+hashlib = _LazyModule('hashlib')
+string = _LazyModule('string')
+csv = _LazyModule('csv')
+tempfile = _LazyModule('tempfile')
+uuid = _LazyModule('uuid')
+futures = _LazyModule('concurrent.futures')
+email = _LazyModule('email', 'email.header', 'email.utils')
+
+CHUNK_SIZE = 3 * 65536
+"""Number of bytes encoded or decoded at a time when streaming attachments, a multiple of 3"""
+
+_MIME_CHUNK = 57 * 1024
+"""Bytes per chunk when writing MIME base64, whole 76 character lines"""
+
+STORE_MAGIC = b'PSTLMSG1'
+"""First bytes of a file written by Email.write_store"""
+
+_STORE_TRAILER = struct.Struct('>Q')
+"""Offset of the JSON index, the last 8 bytes of a store file"""
+
+def _loadJsonDumps():
+    """Returns the fastest installed JSON encoder producing bytes: orjson, ujson or json"""
+    try:
+        import orjson
+
+        return orjson.dumps
+    except ImportError:
+        pass
+    try:
+        import ujson
+
+        return lambda obj: ujson.dumps(obj, ensure_ascii=False, escape_forward_slashes=False).encode('utf-8')
+    except ImportError:
+        return lambda obj: json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def _jsonDumps(obj):
+    """Default JSON encoder. Imports the encoder on first use and replaces itself with it"""
+    global _jsonDumps, jsonEncoder
+    dumps = _loadJsonDumps()
+    if jsonEncoder is _jsonDumps:
+        jsonEncoder = dumps
+    _jsonDumps = dumps
+    return dumps(obj)
+
+_SIGNATURES = {
+    b'%PDF-': 'application/pdf',
+    b'\x89PNG\r\n\x1a\n': 'image/png',
+    b'\xff\xd8\xff': 'image/jpeg',
+    b'PK\x03\x04': 'application/zip',
+    b'BEGIN:VCALENDAR': 'text/calendar',
+}
+"""MIME types by the first bytes of a file, for the common types detected without libmagic"""
+
+_SIGNATURE_LENGTHS = sorted({len(prefix) for prefix in _SIGNATURES})
+
+_OOXML_TYPES = (
+    (b'word/', 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'),
+    (b'xl/', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+    (b'ppt/', 'application/vnd.openxmlformats-officedocument.presentationml.presentation'),
+)
+"""Office Open XML types by the folder of their parts, told apart from plain ZIP files"""
+
+_EXTENSIONS = {
+    'application/pdf': '.pdf',
+    'image/png': '.png',
+    'image/jpeg': '.jpg',
+    'application/zip': '.zip',
+    'text/calendar': '.ics',
+    'text/csv': '.csv',
+    'application/vnd.openxmlformats-officedocument.wordprocessingml.document': '.docx',
+    'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet': '.xlsx',
+    'application/vnd.openxmlformats-officedocument.presentationml.presentation': '.pptx',
+}
+"""Extensions of the built in types, used when the mimetypes database does not list them"""
+
+_GENERIC_TYPES = frozenset(('', 'application/octet-stream', 'binary/octet-stream', 'application/unknown'))
+"""Declared MIME types that say nothing about the file, so the type is detected from the data instead"""
+
+INTERN_ADDRESSES = False
+"""When True, Addressee names and emails are interned, so repeated senders and recipients share one string"""
 
 
 class Addressee:
     """Class for Storing name and Email Address, to allow easy creation of recipient headers"""
+    __slots__ = ('name', 'email')
+
     name: str
     """The name of adressee."""
 
@@ -23,72 +131,375 @@ class Addressee:
 
     def __init__(self, name: str, email:str):
         """Make an addresse. Requires name and email"""
+        if INTERN_ADDRESSES:
+            name = sys.intern(name) if name else name
+            email = sys.intern(email) if email else email
         self.name = name
         self.email = email
 
     def sendFormat(self, loud: bool = True):
-        """Return appendable string"""
-        return "{} <{}>".format(self.name, self.email)
+        """Return appendable string. Names with commas or other specials are quoted, so it parses back as one address"""
+        return "{} <{}>".format(_quoteName(self.name), self.email)
 
 
 class Attachment:
     """Attachment Class"""
+    __slots__ = ('name', 'ext', 'content_type', 'digest', 'file', '_data', '_mime_type', '_extension')
+
     name: str
     """File name of file if available. Defaults to file"""
-    data : str
-    """Base64 data representation of file"""
     ext : str
+    content_type: str
+    """MIME type of the file. Detected from the data when not given"""
+
+    digest: str
+    """Content hash when the data comes from an AttachmentStore"""
 
-    def __init__(self, name: str=None):
-        """Creates empty attachment"""
+    file: object
+    """Binary file holding the decoded data, set by Email.import_stream. data is encoded from it on first access"""
+
+    SNIFF_SIZE = 8192
+    """Number of decoded bytes used to detect the MIME type"""
+
+    def __init__(self, name: str=None, content_type: str=None):
+        """Creates empty attachment. Passing content_type skips MIME detection"""
         if name:
             self.name = name
         self.ext = None
+        self.content_type = content_type
+        self.digest = None
+        self.file = None
         self.data = ''
 
-
-    def sendFormat(self):
-        """Creates an attachment array"""
-        decoded_bytes = base64.b64decode(self.data)
-
-        # Use python-magic to get the MIME type
-        mime_type = magic.from_buffer(decoded_bytes, mime=True)
-
-        #print(f'MIME type: {mime_type}')
-        extension = mimetypes.guess_extension(mime_type)
-
-        # Print the MIME type and extension
-        #print(f'MIME type: {mime_type}')
-        #print(f'Extension: {extension}')
+    @property
+    def data(self):
+        """Base64 data representation of file"""
+        if self._data is None and self.file is not None:
+            self.file.seek(0)
+            self._data = _encodeStream(self.file)
+        return self._data
+
+    @data.setter
+    def data(self, value: str):
+        self._data = value
+        self._mime_type = None
+        self._extension = None
+
+    def mimeType(self):
+        """Returns the MIME type, detecting it from the start of the data once"""
+        if self.content_type:
+            return self.content_type
+        if self._mime_type is None and self._data is None and self.file is not None:
+            self.file.seek(0)
+            self._mime_type = sniffMimeType(self.file.read(self.SNIFF_SIZE))
+        elif self._mime_type is None:
+            # Only decode enough base64 to cover SNIFF_SIZE bytes
+            head = self._data[:(self.SNIFF_SIZE // 3) * 4 + 1024]
+            head = "".join(head.split())[:(self.SNIFF_SIZE // 3) * 4]
+            head = head[:len(head) - len(head) % 4]
+            self._mime_type = sniffMimeType(base64.b64decode(head))
+        return self._mime_type
+
+    def extension(self):
+        """Returns the file extension matching the MIME type"""
+        mime_type = self.mimeType()
+        if self._extension is None or self._extension[0] != mime_type:
+            self._extension = (mime_type, mimetypes.guess_extension(mime_type) or _EXTENSIONS.get(mime_type))
+        return self._extension[1]
+
+    def fileName(self):
+        """Returns the file name with the detected extension, or the original one when the type is unknown"""
+        extension = self.extension()
+        if self.ext and (extension is None or self.mimeType() in _GENERIC_TYPES):
+            extension = self.ext
 
         try:
-            #print("{}.{}".format(self.name, extension))
-            name = "{}{}".format(self.name, extension)
-        except:
-            #print("file{}".format(extension))
-            name = "file{}".format(extension)
+            return "{}{}".format(self.name, extension)
+        except AttributeError:
+            return "file{}".format(extension)
 
-        return {"name":name, "data":self.data}
+    def sendFormat(self):
+        """Creates an attachment array"""
+        return {"name":self.fileName(), "data":self.data}
+
+    def writeMime(self, fileobj):
+        """Writes the attachment as a base64 MIME part body, in 76 character CRLF lines"""
+        if self._data is None and self.file is not None:
+            self.file.seek(0)
+            while True:
+                chunk = self.file.read(_MIME_CHUNK)
+                if not chunk:
+                    return
+                fileobj.write(base64.encodebytes(chunk).replace(b'\n', b'\r\n'))
+
+        remainder = ''
+        step = _MIME_CHUNK // 3 * 4
+        data = self.data
+        for start in range(0, len(data), step):
+            chunk = remainder + data[start:start + step]
+            if '\n' in chunk or '\r' in chunk:
+                chunk = ''.join(chunk.split())
+            cut = len(chunk) - len(chunk) % 4
+            fileobj.write(base64.encodebytes(base64.b64decode(chunk[:cut])).replace(b'\n', b'\r\n'))
+            remainder = chunk[cut:]
+        if remainder:
+            fileobj.write(base64.encodebytes(base64.b64decode(remainder)).replace(b'\n', b'\r\n'))
 
     def fixFile(self):
         """Function to fix base64"""
-        self.data = self.data.replace('\n', '')
+        if '\n' in self.data:
+            self.data = self.data.replace('\n', '')
 
     def fileBytes(self):
         """Returns the file content in bytes format"""
         self.fixFile()
         return base64.b64decode(self.data)
 
-    def makeFile(self):
+    @classmethod
+    def from_stream(cls, fileobj, name: str=None, content_type: str=None):
+        """Creates an attachment from a binary file object, encoding it in chunks"""
+        attachment = cls(name, content_type)
+        attachment.data = _encodeStream(fileobj)
+        return attachment
+
+    @classmethod
+    def from_path(cls, path, name: str=None, content_type: str=None):
+        """Creates an attachment from a file on disk. Name and ext default to the file name"""
+        stem, ext = os.path.splitext(os.path.basename(path))
+        with open(path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if size == 0:
+                attachment = cls(name or stem, content_type)
+            else:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                    view = memoryview(mapped)
+                    try:
+                        parts = [base64.b64encode(view[start:start + CHUNK_SIZE]).decode('ascii')
+                                 for start in range(0, size, CHUNK_SIZE)]
+                    finally:
+                        view.release()
+                attachment = cls(name or stem, content_type)
+                attachment.data = ''.join(parts)
+        attachment.ext = ext or None
+        return attachment
+
+    def write_to(self, fileobj):
+        """Writes the decoded file to a binary file object in chunks. Returns the number of bytes written"""
+        written = 0
+        if self._data is None and self.file is not None:
+            self.file.seek(0)
+            while True:
+                chunk = self.file.read(CHUNK_SIZE)
+                if not chunk:
+                    return written
+                written += fileobj.write(chunk)
+
+        remainder = ''
+        step = CHUNK_SIZE // 3 * 4
+        for start in range(0, len(self.data), step):
+            chunk = remainder + ''.join(self.data[start:start + step].split())
+            cut = len(chunk) - len(chunk) % 4
+            written += fileobj.write(base64.b64decode(chunk[:cut]))
+            remainder = chunk[cut:]
+        if remainder:
+            written += fileobj.write(base64.b64decode(remainder))
+        return written
+
+    def makeFile(self, path: str=None):
+        """Writes the file to path, defaults to file<ext> in the working directory"""
         try:
-            file_content = self.fileBytes()
-            with open("file{}".format(self.ext), "wb") as f:
-                f.write(file_content)
+            with open(path or "file{}".format(self.ext), "wb") as f:
+                self.write_to(f)
         except Exception as e:
             print(str(e))
 
+class _ViewFile(io.RawIOBase):
+    """Read only binary file over a memoryview, reading from a mapped store without copying it whole"""
+
+    def __init__(self, view):
+        self._view = view
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, buffer):
+        size = min(len(buffer), len(self._view) - self._pos)
+        buffer[:size] = self._view[self._pos:self._pos + size]
+        self._pos += size
+        return size
+
+    def seek(self, offset: int, whence: int=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence == io.SEEK_END:
+            offset += len(self._view)
+        self._pos = max(offset, 0)
+        return self._pos
+
+    def tell(self):
+        return self._pos
+
+def sniffMimeType(head: bytes):
+    """Returns the MIME type of data from its first bytes. Common types are matched against a table of
+    signatures, others are detected by libmagic, or are application/octet-stream when it is missing"""
+    mime_type = None
+    for length in _SIGNATURE_LENGTHS:
+        mime_type = _SIGNATURES.get(head[:length])
+        if mime_type is not None:
+            break
+
+    if mime_type == 'application/zip':
+        mime_type = _zipType(head)
+    elif mime_type is None:
+        mime_type = _textType(head)
+    if mime_type is not None:
+        return mime_type
+
+    global magic
+    if magic is not None:
+        try:
+            mime_type = magic.from_buffer(head, mime=True)
+        except ImportError:
+            magic = None
+        else:
+            # libmagic calls most text with commas on every line CSV, prose included
+            if mime_type == 'text/csv' and _notTable(_tableShape(head)):
+                return 'text/plain'
+            return mime_type
+    return 'application/octet-stream'
+
+
+def _zipType(head: bytes):
+    """Office Open XML type or application/zip, None for other ZIP based formats such as ODF or JAR"""
+    if b'[Content_Types].xml' in head:
+        for folder, mime_type in _OOXML_TYPES:
+            if folder in head:
+                return mime_type
+        return None
+    if head[30:38] == b'mimetype' or b'META-INF/' in head:
+        return None
+    return 'application/zip'
+
+
+def _textType(head: bytes):
+    """text/calendar or text/csv for UTF-8 text, None for anything else, which is left to libmagic"""
+    if b'\0' in head:
+        return None
+    text = head[3:] if head.startswith(codecs.BOM_UTF8) else head
+    if text.lstrip().startswith(b'BEGIN:VCALENDAR'):
+        return 'text/calendar'
+
+    shape = _tableShape(head)
+    if shape is not None and shape[0] > 1 and not shape[1]:
+        return 'text/csv'
+    return None
+
+
+def _tableShape(head: bytes):
+    """Reads UTF-8 text as comma separated rows. Returns (columns, prose): the number of columns when every
+    row has the same, else 0, and whether the fields read as sentences, with a space after every comma and
+    a phrase of 4 or more words. None for text that is not UTF-8, JSON or markup, or has fewer than 2 rows"""
+    lines = head.splitlines()
+    if len(head) >= Attachment.SNIFF_SIZE:
+        # The last line may be cut short
+        lines = lines[:-1]
+    try:
+        text = b'\n'.join(lines[:20]).decode('utf-8-sig')
+    except UnicodeDecodeError:
+        return None
+    if text.lstrip()[:1] in ('{', '[', '<'):
+        return None
+    try:
+        rows = [row for row in csv.reader(io.StringIO(text)) if row]
+    except csv.Error:
+        return None
+    if len(rows) < 2:
+        return None
+
+    columns = len(rows[0])
+    if any(len(row) != columns for row in rows):
+        columns = 0
+    prose = (all(not field or field[0].isspace() for row in rows for field in row[1:])
+             and any(len(field.split()) >= 4 for row in rows for field in row))
+    return columns, prose
+
+
+def _notTable(shape):
+    """True for a _tableShape that is clearly not a table: a single or varying number of columns, or prose"""
+    return shape is not None and (shape[0] < 2 or shape[1])
+
+
+def _encodeStream(fileobj):
+    """Base64 encodes a binary file object in chunks"""
+    parts = []
+    carry = b''
+    while True:
+        chunk = fileobj.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        chunk = carry + chunk
+        cut = len(chunk) - len(chunk) % 3
+        parts.append(base64.b64encode(chunk[:cut]).decode('ascii'))
+        carry = chunk[cut:]
+    parts.append(base64.b64encode(carry).decode('ascii'))
+    return ''.join(parts)
+
+
+class AttachmentStore:
+    """Registry of attachment data keyed by content hash, so identical files are held in memory once.
+    Attachments made by the store share the same data string and detected MIME type."""
+
+    def __init__(self):
+        self._data = {}
+        self._mime_types = {}
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, digest: str):
+        return digest in self._data
+
+    def add(self, data: str, content_type: str=None):
+        """Stores base64 data if not already present and returns its digest"""
+        data = data.replace('\n', '')
+        digest = hashlib.sha256(data.encode('ascii')).hexdigest()
+        if digest not in self._data:
+            self._data[digest] = data
+            if content_type:
+                self._mime_types[digest] = content_type
+        return digest
+
+    def get(self, digest: str):
+        """Returns the shared base64 data for a digest"""
+        return self._data[digest]
+
+    def attachment(self, digest: str, name: str=None):
+        """Makes an Attachment referencing the stored data"""
+        if digest not in self._mime_types:
+            probe = Attachment()
+            probe.data = self._data[digest]
+            self._mime_types[digest] = probe.mimeType()
+
+        attachment = Attachment(name, self._mime_types[digest])
+        attachment.data = self._data[digest]
+        attachment.digest = digest
+        return attachment
+
+    def discard(self, digest: str):
+        """Removes data from the store. Existing attachments keep their reference"""
+        self._data.pop(digest, None)
+        self._mime_types.pop(digest, None)
+
+
 class Email:
     """Email Class"""
+    __slots__ = ('sender', 'srv_account', 'rply_to', 'reciever', 'cc', 'bcc', 'subject',
+                 'html', 'plain_text', 'attachments', 'tag', 'extra', '_json')
+
     sender: Addressee
     """The sender name and email, uses Addresse Class"""
 
@@ -123,6 +534,9 @@ class Email:
     - Fourth item
     """
 
+    MAX_RECIPIENTS = 50
+    """Recipients per message used by split when no limit is given"""
+
     def __init__(self):
         self.sender = None
         self.srv_account =None
@@ -136,6 +550,7 @@ class Email:
         self.attachments = []
         self.tag = None
         self.extra = {}
+        self._json = None
 
     def addReciever(self, addressee:Addressee):
         """Add a reciever"""
@@ -149,26 +564,38 @@ class Email:
         """Add a black carbon copy (BCC) reciever"""
         self.bcc.append(addressee)
 
-    def makeEmail(self):
-        """Function that creates the JSON Email, preparing the system to send emails."""
+    def recipientSet(self):
+        """Returns the lower cased addresses of all to, cc and bcc recievers"""
+        return {person.email.lower() for people in (self.reciever, self.cc, self.bcc) for person in people}
 
-        data = {}
-        #First create header info for senders
+    def uniqueRecipients(self):
+        """Returns the to, cc and bcc Addressee lists, dropping addresses already listed, ignoring case"""
+        return _uniqueRecipients(self.reciever, self.cc, self.bcc)
 
-        recievers = []
-        for person in self.reciever:
-            recievers.append(person.sendFormat())
-        data['to'] = recievers
+    def _recipients(self):
+        """Returns the formatted to, cc and bcc lists, dropping addresses already listed, ignoring case"""
+        return [[person.sendFormat() for person in people] for people in self.uniqueRecipients()]
 
-        recievers = []
-        for person in self.cc:
-            recievers.append(person.sendFormat())
-        data['cc'] = recievers
+    def split(self, max_recipients: int=None):
+        """Yields makeEmail payloads with at most max_recipients addresses each, in the fewest payloads.
+        Recipients keep their to, cc or bcc field. The payloads share one body and attachment list."""
+        max_recipients = max_recipients or self.MAX_RECIPIENTS
+        data = self.makeEmail()
+        people = [(field, address) for field in ('to', 'cc', 'bcc') for address in data[field]]
 
-        recievers = []
-        for person in self.bcc:
-            recievers.append(person.sendFormat())
-        data['bcc'] = recievers
+        for start in range(0, max(len(people), 1), max_recipients):
+            payload = data.copy()
+            payload['to'], payload['cc'], payload['bcc'] = [], [], []
+            for field, address in people[start:start + max_recipients]:
+                payload[field].append(address)
+            yield payload
+
+    def makeEmail(self):
+        """Function that creates the JSON Email, preparing the system to send emails."""
+
+        data = {}
+        #First create header info for senders, each address only once across to, cc and bcc
+        data['to'], data['cc'], data['bcc'] = self._recipients()
 
         data['from'] = self.sender.sendFormat()
         if self.srv_account:
@@ -193,28 +620,350 @@ class Email:
 
         return data
 
-    def extractAddress(self, text):
-        addresses = []
+    def write_mime(self, fileobj):
+        """Writes the email as an RFC 5322 message to a binary file object. Bcc is not included in the headers"""
+        domain = self.sender.email.rpartition('@')[2] or None
+        headers = [('From', _mimeAddress(self.sender))]
+        if self.srv_account:
+            headers.append(('Sender', _mimeAddress(self.srv_account)))
+        if self.reciever:
+            headers.append(('To', ', '.join(_mimeAddress(person) for person in self.reciever)))
+        if self.cc:
+            headers.append(('Cc', ', '.join(_mimeAddress(person) for person in self.cc)))
+        if self.rply_to:
+            headers.append(('Reply-To', _mimeAddress(self.rply_to)))
+        headers.append(('Subject', _mimeHeader(self.subject or '')))
+        headers.append(('Date', email.utils.formatdate(localtime=True)))
+        headers.append(('Message-ID', email.utils.make_msgid(domain=domain)))
+        headers.append(('MIME-Version', '1.0'))
+        fileobj.write(''.join('{}: {}\r\n'.format(key, value) for key, value in headers).encode('ascii'))
+
+        bodies = []
+        if self.plain_text:
+            bodies.append(('plain', self.plain_text))
+        if self.html:
+            bodies.append(('html', self.html))
+        if not bodies:
+            bodies.append(('plain', ''))
+
+        mixed = _mimeBoundary() if self.attachments else None
+        if mixed:
+            fileobj.write('Content-Type: multipart/mixed; boundary="{0}"\r\n\r\n--{0}\r\n'.format(mixed).encode('ascii'))
+
+        if len(bodies) > 1:
+            alternative = _mimeBoundary()
+            fileobj.write('Content-Type: multipart/alternative; boundary="{}"\r\n\r\n'.format(alternative).encode('ascii'))
+            for subtype, text in bodies:
+                fileobj.write('--{}\r\n'.format(alternative).encode('ascii'))
+                _writeMimeText(fileobj, subtype, text)
+            fileobj.write('--{}--\r\n'.format(alternative).encode('ascii'))
+        else:
+            _writeMimeText(fileobj, *bodies[0])
 
-        pattern = r'[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+'
+        for attachment in self.attachments:
+            name = _headerText(attachment.fileName())
+            if name.isascii():
+                params = 'name="{0}"\r\nContent-Disposition: attachment; filename="{0}"'.format(name.replace('"', ''))
+            else:
+                quoted = email.utils.encode_rfc2231(name, 'utf-8')
+                params = "name*={0}\r\nContent-Disposition: attachment; filename*={0}".format(quoted)
+            fileobj.write('--{}\r\nContent-Type: {}; {}\r\nContent-Transfer-Encoding: base64\r\n\r\n'.format(
+                mixed, attachment.mimeType(), params).encode('ascii'))
+            attachment.writeMime(fileobj)
+
+        if mixed:
+            fileobj.write('--{}--\r\n'.format(mixed).encode('ascii'))
+
+    @classmethod
+    def from_eml(cls, source, attachment_dir: str=None):
+        """Reads an .eml file path or raw message bytes with eml-parser.
+        Attachments are written to files, temporary spooled files unless attachment_dir is given."""
+        import eml_parser
+
+        if isinstance(source, (bytes, bytearray)):
+            raw = source
+        else:
+            with open(source, 'rb') as f:
+                raw = f.read()
+        parsed = eml_parser.EmlParser(include_raw_body=True, include_attachment_data=True).decode_email_bytes(raw)
+        del raw
+
+        header = parsed['header']
+        fields = header.get('header', {})
+        myEmail = cls()
+
+        sender = email.utils.parseaddr(fields.get('from', [header.get('from', '')])[0])
+        myEmail.sender = Addressee(sender[0], sender[1])
+        if 'sender' in fields:
+            sender = email.utils.parseaddr(fields['sender'][0])
+            myEmail.srv_account = Addressee(sender[0], sender[1])
+        if 'reply-to' in fields:
+            sender = email.utils.parseaddr(fields['reply-to'][0])
+            myEmail.rply_to = Addressee(sender[0], sender[1])
+        if 'to' in fields:
+            myEmail.reciever = parseAddresses(', '.join(fields['to']))
+        if 'cc' in fields:
+            myEmail.cc = parseAddresses(', '.join(fields['cc']))
+        if 'bcc' in fields:
+            myEmail.bcc = parseAddresses(', '.join(fields['bcc']))
+
+        myEmail.subject = header.get('subject')
+        myEmail.extra['date'] = header.get('date')
+        if 'message-id' in fields:
+            myEmail.extra['message_id'] = fields['message-id'][0]
+
+        for body in parsed.get('body', []):
+            if body.get('content_type') == 'text/html' and myEmail.html is None:
+                myEmail.html = body['content']
+            elif body.get('content_type', 'text/plain') == 'text/plain' and myEmail.plain_text is None:
+                myEmail.plain_text = body['content'].replace('\r\n', '\n')
+
+        for part in parsed.get('attachment', []):
+            stem, ext = os.path.splitext(part.get('filename') or 'file')
+            declared = part.get('content_header', {}).get('content-type', [''])[0].split(';')[0].strip()
+            myAttachment = Attachment(stem, _declaredType(declared) or _declaredType(part.get('mime_type_short')))
+            myAttachment.ext = ext or None
+            myAttachment.data = None
+            if attachment_dir:
+                myAttachment.file = tempfile.NamedTemporaryFile(dir=attachment_dir, suffix=ext, delete=False)
+            else:
+                myAttachment.file = tempfile.SpooledTemporaryFile(max_size=CHUNK_SIZE)
+            raw = part.pop('raw')
+            for start in range(0, len(raw), CHUNK_SIZE // 3 * 4):
+                myAttachment.file.write(base64.b64decode(raw[start:start + CHUNK_SIZE // 3 * 4]))
+            myAttachment.file.flush()
+            myEmail.attachments.append(myAttachment)
+
+        return myEmail
+
+    def to_eml(self, path: str=None):
+        """Writes the email as an .eml file, streaming attachments. Returns the bytes when no path is given"""
+        if path is None:
+            return self.to_mime_bytes()
+        with open(path, 'wb') as f:
+            self.write_mime(f)
+
+    def to_mime_bytes(self):
+        """Returns the email as an RFC 5322 message, for sending through the raw API or saving as .eml"""
+        buffer = io.BytesIO()
+        self.write_mime(buffer)
+        return buffer.getvalue()
+
+    def write_store(self, fileobj):
+        """Writes the email in the compact store format to a binary file object.
+        Bodies and decoded attachments are written as raw blobs, followed by a JSON index of the
+        headers and blob positions, and the 8 byte offset of the index."""
+        index = {}
+        index['to'], index['cc'], index['bcc'] = self._recipients()
+        index['from'] = self.sender.sendFormat()
+        if self.srv_account:
+            index['sender'] = self.srv_account.sendFormat()
+        if self.rply_to:
+            index['reply_to'] = self.rply_to.sendFormat()
+        if self.tag:
+            index['tag'] = self.tag
+        index['subject'] = self.subject
 
-        matches = re.findall(pattern, text)
+        offset = fileobj.write(STORE_MAGIC)
+        for key, text in (('plain_body', self.plain_text), ('html_body', self.html)):
+            if text is not None:
+                size = fileobj.write(text.encode('utf-8'))
+                index[key] = [offset, size]
+                offset += size
 
-        for match in matches:
-            start = text.find(match)
-            end = start + len(match)
-            name = text[:start].strip(", \"")
-            email = match
-            thisAdd = Addressee(cleanText(name), email)
-            #print(f"Name: {cleanText(name)}, Email: {email}")
-            addresses.append(thisAdd)
-            text = text[end:]
+        index['attachments'] = []
+        for attachment in self.attachments:
+            size = attachment.write_to(fileobj)
+            index['attachments'].append({'name': getattr(attachment, 'name', None), 'ext': attachment.ext,
+                                         'content_type': attachment.mimeType(), 'offset': offset, 'size': size})
+            offset += size
+
+        fileobj.write(json.dumps(index).encode('utf-8'))
+        fileobj.write(_STORE_TRAILER.pack(offset))
+
+    def to_store(self, path: str=None):
+        """Writes the email to a store file. Returns the bytes when no path is given"""
+        if path is None:
+            buffer = io.BytesIO()
+            self.write_store(buffer)
+            return buffer.getvalue()
+        with open(path, 'wb') as f:
+            self.write_store(f)
+
+    @classmethod
+    def from_store(cls, source, bodies: bool=True):
+        """Reads an email written by write_store from a path or bytes. Paths are memory mapped, the
+        attachments read their data from the mapping when first used. Without bodies only the headers
+        and attachment list are read."""
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            view = memoryview(source)
+        else:
+            with open(source, 'rb') as f:
+                view = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+        if bytes(view[:len(STORE_MAGIC)]) != STORE_MAGIC:
+            raise ValueError("Not an email store file")
+
+        start, = _STORE_TRAILER.unpack(view[-_STORE_TRAILER.size:])
+        index = json.loads(bytes(view[start:-_STORE_TRAILER.size]))
+
+        myEmail = cls()
+        myEmail._readAddresses(index)
+        if bodies:
+            if 'plain_body' in index:
+                offset, size = index['plain_body']
+                myEmail.plain_text = str(view[offset:offset + size], 'utf-8')
+            if 'html_body' in index:
+                offset, size = index['html_body']
+                myEmail.html = str(view[offset:offset + size], 'utf-8')
+
+        for attachment in index['attachments']:
+            myAttachment = Attachment(attachment['name'], attachment['content_type'])
+            myAttachment.ext = attachment['ext']
+            myAttachment.data = None
+            myAttachment.file = _ViewFile(view[attachment['offset']:attachment['offset'] + attachment['size']])
+            myEmail.attachments.append(myAttachment)
+        return myEmail
+
+    def _fingerprint(self):
+        """Tuple of every field makeEmail reads and the JSON encoder. Unchanged strings compare by identity,
+        so this is cheap"""
+        return (
+            tuple((person.name, person.email) if person else None for person in
+                  (self.sender, self.srv_account, self.rply_to, *self.reciever, *self.cc, *self.bcc)),
+            len(self.reciever), len(self.cc), self.subject, self.html, self.plain_text, self.tag,
+            tuple((getattr(attachment, 'name', None), attachment.ext, attachment.content_type,
+                   attachment._mime_type, attachment.data)
+                  for attachment in self.attachments),
+            jsonEncoder,
+        )
+
+    def to_json_bytes(self, cache: bool=False):
+        """Returns the makeEmail payload encoded as JSON bytes, ready to send.
+        Uses orjson or ujson when installed. Attachment data is spliced in without being escaped again.
+        With cache, the bytes are kept and returned again while the email is unchanged."""
+        if cache:
+            key = self._fingerprint()
+            if self._json is not None and self._json[0] == key:
+                return self._json[1]
+
+        data = self.makeEmail()
+        attachments = data.pop('attachments')
+        parts = [_jsonObjectHead(data), b',"attachments":[']
+        for i, attachment in enumerate(attachments):
+            if i:
+                parts.append(b',')
+            encoded = attachment['data']
+            if '\n' in encoded or '\r' in encoded:
+                encoded = ''.join(encoded.split())
+            parts.append(b'{"name":' + _encodeJson(attachment['name']) + b',"data":"')
+            parts.append(encoded.encode('ascii'))
+            parts.append(b'"}')
+        parts.append(b']}')
+        result = b''.join(parts)
+
+        if cache:
+            # Taken again as makeEmail detected the attachment types and may have loaded the JSON encoder
+            self._json = (self._fingerprint(), result)
+        return result
+
+    def batch(self, recipients):
+        """Yields a makeEmail payload per recipient, sharing everything except to, subject and body.
+        See EmailTemplate.render for the recipient format."""
+        template = EmailTemplate(self)
+        for recipient in recipients:
+            if isinstance(recipient, Addressee):
+                yield template.render(recipient)
+            else:
+                yield template.render(*recipient)
 
-        return addresses
+    def extractAddress(self, text):
+        """Parses a To/Cc header into a list of Addressee"""
+        return parseAddresses(text)
 
     def importEmail(self, jsonString):
         data = json.loads(jsonString)
+        self._importHeaders(data)
 
+        self.html = data['html_body']
+        self.plain_text = data['plain_body']
+
+        if data['attachment_quantity'] > 0:
+            self.attachments.extend(importAttachments(data['attachments']))
+
+    def import_stream(self, fileobj, sink=None, chunk_size: int=CHUNK_SIZE):
+        """Imports a webhook payload incrementally from a file object or socket file.
+        Attachment data is decoded chunk by chunk into sink(), which returns a binary file,
+        by default a SpooledTemporaryFile kept in memory up to chunk_size. Attachment.file refers to it."""
+        if sink is None:
+            sink = lambda: tempfile.SpooledTemporaryFile(max_size=chunk_size)
+        reader = _StreamReader(fileobj, chunk_size)
+        data = {}
+
+        reader.expect('{')
+        if reader.peek() == '}':
+            reader.pos += 1
+        else:
+            while True:
+                key = reader.readValue()
+                reader.expect(':')
+                if key == 'attachments':
+                    data[key] = self._streamAttachments(reader, sink)
+                else:
+                    data[key] = reader.readValue()
+                if reader.peek() == '}':
+                    reader.pos += 1
+                    break
+                reader.expect(',')
+
+        self._importHeaders(data)
+        self.html = data['html_body']
+        self.plain_text = data['plain_body']
+        self.attachments.extend(data.get('attachments') or [])
+
+    def _streamAttachments(self, reader, sink):
+        """Reads the attachments array of a payload, writing the data of each to a new sink"""
+        attachments = []
+        if reader.peek() == 'n':
+            return reader.readValue()
+
+        reader.expect('[')
+        if reader.peek() == ']':
+            reader.pos += 1
+            return attachments
+
+        while True:
+            myAttachment = Attachment()
+            myAttachment.data = None
+            reader.expect('{')
+            while reader.peek() != '}':
+                key = reader.readValue()
+                reader.expect(':')
+                if key == 'data':
+                    myAttachment.file = sink()
+                    reader.readBase64(myAttachment.file)
+                elif key == 'filename':
+                    filename = reader.readValue()
+                    myAttachment.name = filename.split(".")[0]
+                    if "." in filename:
+                        myAttachment.ext = ".{}".format(filename.split(".")[1])
+                elif key == 'content_type':
+                    myAttachment.content_type = _declaredType(reader.readValue())
+                else:
+                    reader.readValue()
+                if reader.peek() == ',':
+                    reader.pos += 1
+            reader.pos += 1
+            if myAttachment.file is None:
+                myAttachment.data = ''
+            attachments.append(myAttachment)
+
+            if reader.peek() == ']':
+                reader.pos += 1
+                return attachments
+            reader.expect(',')
+
+    def _importHeaders(self, data):
+        """Reads the header fields of a Postal webhook payload"""
         sender = email.utils.parseaddr(data["from"])
         self.sender = Addressee(sender[0], sender[1])
 
@@ -224,37 +973,38 @@ class Email:
             self.cc = self.extractAddress(data['cc'])
         self.extra['date'] = data['date']
 
-        self.html = data['html_body']
-        self.plain_text = data['plain_body']
-
-        if data['attachment_quantity'] > 0:
-            attachments = data['attachments']
-            for attachment in attachments:
-                myAttachment = Attachment()
-                myAttachment.data = attachment['data']
-                myAttachment.name = attachment['filename'].split(".")[0]
-                myAttachment.ext = ".{}".format(attachment['filename'].split(".")[1])
-                self.attachments.append(myAttachment)
-
         self.subject=data['subject']
 
         self.extra['id'] = data['id']
 
     def readSendFormat(self, input):
-        """This function reads the sendFormat function output, for easy storage"""
+        """This function reads the sendFormat function output, for easy storage.
+        write_store keeps a smaller copy with the attachments unencoded"""
         #data = json.loads(input)
         data = input
-        for person in data['to']:
-            personData = email.utils.parseaddr(person)
-            self.reciever.append(Addressee(personData[0], personData[1]))
+        self._readAddresses(data)
+
+        if 'plain_body' in data:
+            self.plain_text = data['plain_body']
+
+        if 'html_body' in data:
+            self.html = data['html_body']
+
+        for attachment in data['attachments']:
+            myAttachment = Attachment()
+            myAttachment.data = attachment['data']
+            myAttachment.name = attachment['name'].split(".")[0]
+            myAttachment.ext = ".{}".format(attachment['name'].split(".")[1])
+            self.attachments.append(myAttachment)
 
-        for person in data['cc']:
-            personData = email.utils.parseaddr(person)
-            self.reciever.append(Addressee(personData[0], personData[1]))
+        return data
 
-        for person in data['bcc']:
-            personData = email.utils.parseaddr(person)
-            self.reciever.append(Addressee(personData[0], personData[1]))
+    def _readAddresses(self, data):
+        """Reads the addresses, tag and subject of a makeEmail payload, keeping to, cc and bcc apart"""
+        for field, people in (('to', self.reciever), ('cc', self.cc), ('bcc', self.bcc)):
+            for person in data.get(field, ()):
+                personData = email.utils.parseaddr(person)
+                people.append(Addressee(personData[0], personData[1]))
 
         sender = email.utils.parseaddr(data['from'])
         self.sender = Addressee(sender[0], sender[1])
@@ -273,22 +1023,601 @@ class Email:
 
         self.subject = data['subject']
 
-        if 'plain_body' in data:
-            self.plain_text = data['plain_body']
-
-        if 'html_body' in data:
-            self.html = data['html_body']
 
-        for attachment in data['attachments']:
-            myAttachment = Attachment()
-            myAttachment.data = attachment['data']
-            myAttachment.name = attachment['name'].split(".")[0]
-            myAttachment.ext = ".{}".format(attachment['name'].split(".")[1])
-            self.attachments.append(myAttachment)
+class EmailTemplate:
+    """Precomputed invariant part of an Email, for sending it to many recipients.
+    Subject and bodies may contain $placeholders, filled per recipient with string.Template."""
+    email: Email
+    """The Email the template was built from"""
 
+    def __init__(self, email: Email):
+        """Builds the static payload once: sender, reply_to, tag, cc, bcc and attachments"""
+        self.email = email
+        self._skeleton = email.makeEmail()
+        # Recipients are given to render, so cc and bcc are not deduplicated against the to of email
+        self._copies = _uniqueRecipients(email.cc, email.bcc)
+        self._copied = {person.email.lower() for people in self._copies for person in people}
+        self._skeleton['cc'], self._skeleton['bcc'] = [[person.sendFormat() for person in people]
+                                                       for people in self._copies]
+        self._fields = {}
+        for field in ('subject', 'plain_body', 'html_body'):
+            text = self._skeleton.get(field)
+            if text and '$' in text:
+                self._fields[field] = string.Template(text)
+
+    def render(self, to, substitutions: dict=None):
+        """Returns the payload for one recipient.
+        to is an Addressee or list of Addressee. $name and $email are filled from the first one."""
+        if isinstance(to, Addressee):
+            to = [to]
+        data = self._skeleton.copy()
+        to, = _uniqueRecipients(to)
+        data['to'] = [person.sendFormat() for person in to]
+        if not self._copied.isdisjoint(person.email.lower() for person in to):
+            # As in makeEmail, an address in to is not listed again in cc or bcc
+            data['cc'], data['bcc'] = [[person.sendFormat() for person in people]
+                                       for people in _uniqueRecipients(to, *self._copies)[1:]]
+
+        if self._fields:
+            values = {'name': to[0].name, 'email': to[0].email} if to else {}
+            if substitutions:
+                values.update(substitutions)
+            for field, template in self._fields.items():
+                data[field] = template.safe_substitute(values)
         return data
 
 
+def _uniqueRecipients(*groups):
+    """Returns a copy of each list of Addressee without the addresses listed before it, ignoring case"""
+    seen = set()
+    lists = []
+    for people in groups:
+        unique = []
+        for person in people:
+            key = person.email.lower()
+            if key not in seen:
+                seen.add(key)
+                unique.append(person)
+        lists.append(unique)
+    return lists
+
+
+def _loadEml(path, attachment_dir):
+    """Process pool worker for iter_eml_directory, returning a picklable Email and its attachment paths"""
+    myEmail = Email.from_eml(path, attachment_dir)
+    paths = []
+    for attachment in myEmail.attachments:
+        if attachment_dir:
+            attachment.file.close()
+            paths.append(attachment.file.name)
+        else:
+            attachment.data = attachment.data
+            attachment.file.close()
+            paths.append(None)
+        attachment.file = None
+    return myEmail, paths
+
+
+def iter_eml_directory(directory: str, workers: int=None, attachment_dir: str=None, pattern: str='*.eml'):
+    """Parses every .eml file in a directory across a process pool, yielding Email objects in file order.
+    With attachment_dir, attachments are written there and opened as Attachment.file, otherwise they are
+    returned as base64 data. The caller removes the files in attachment_dir when done."""
+    paths = sorted(glob.glob(os.path.join(directory, pattern)))
+    with futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        for myEmail, files in executor.map(_loadEml, paths, [attachment_dir] * len(paths), chunksize=8):
+            for attachment, path in zip(myEmail.attachments, files):
+                if path:
+                    attachment.file = open(path, 'rb')
+            yield myEmail
+
+
+jsonEncoder = _jsonDumps
+"""Function encoding an object to JSON bytes, used by Email.to_json_bytes. Replace with setJsonEncoder"""
+
+
+def setJsonEncoder(dumps=None):
+    """Sets the function used to encode JSON as bytes or str, or restores the default orjson, ujson or json encoder"""
+    global jsonEncoder
+    jsonEncoder = dumps or _jsonDumps
+
+
+def _encodeJson(obj):
+    """Encodes obj with jsonEncoder as UTF-8 bytes without trailing whitespace"""
+    encoded = jsonEncoder(obj)
+    if isinstance(encoded, str):
+        encoded = encoded.encode('utf-8')
+    return encoded.rstrip()
+
+
+def _jsonObjectHead(data: dict):
+    """Encodes a dict without its closing brace, so more members can be appended"""
+    encoded = _encodeJson(data)
+    if not encoded.endswith(b'}'):
+        raise ValueError("JSON encoder did not return an object: {!r}".format(encoded[-20:]))
+    return encoded[:-1]
+
+
+def _attachShared(name: str):
+    """Attaches to a shared memory block created by build_payloads.
+    Pool workers share the parent's resource tracker, which unlinks the block once."""
+    from multiprocessing import shared_memory
+
+    try:
+        return shared_memory.SharedMemory(name, track=False)
+    except TypeError:
+        return shared_memory.SharedMemory(name)
+
+
+def _buildPayload(job):
+    """Process pool worker for build_payloads, returning the JSON bytes of one email"""
+    myEmail, shared = job
+    data = myEmail.makeEmail()
+    del data['attachments']
+
+    parts = [_jsonObjectHead(data), b',"attachments":[']
+    blocks = []
+    views = []
+    try:
+        for i, (block, size, name, ext, content_type) in enumerate(shared):
+            memory = _attachShared(block)
+            blocks.append(memory)
+            view = memory.buf[:size]
+            views.append(view)
+
+            myAttachment = Attachment(name, content_type)
+            myAttachment.ext = ext
+            myAttachment.data = bytes(view[:Attachment.SNIFF_SIZE // 3 * 4]).decode('ascii')
+            if i:
+                parts.append(b',')
+            parts.append(b'{"name":' + _encodeJson(myAttachment.fileName()) + b',"data":"')
+            parts.append(view)
+            parts.append(b'"}')
+        parts.append(b']}')
+        return b''.join(parts)
+    finally:
+        parts.clear()
+        for view in views:
+            view.release()
+        for memory in blocks:
+            memory.close()
+
+
+def _buildPayloadChunk(jobs):
+    """Process pool worker for build_payloads, returning the JSON bytes of a chunk of emails"""
+    return [_buildPayload(job) for job in jobs]
+
+
+def build_payloads(emails, workers: int=None, chunksize: int=16):
+    """Builds the JSON request body of many emails across a process pool, yielding bytes in order.
+    Attachment data is placed once in shared memory and referenced by the workers, so identical
+    attachments are not pickled per email. emails is read as the workers need it, a few chunks ahead,
+    and a shared block is freed once no email in flight uses it."""
+    from multiprocessing import shared_memory
+
+    # Shared block, size, number of emails in flight using it and the attachment data, by content hash
+    shared = {}
+    # Content hash of the attachment data in shared by id, so the same string is not hashed again
+    hashes = {}
+
+    def share(data):
+        known = hashes.get(id(data))
+        if known is not None and known[0] is data:
+            digest = known[1]
+        else:
+            encoded = ''.join(data.split()).encode('ascii') if '\n' in data else data.encode('ascii')
+            digest = hashlib.sha256(encoded).digest()
+            if digest not in shared:
+                memory = shared_memory.SharedMemory(create=True, size=max(len(encoded), 1))
+                memory.buf[:len(encoded)] = encoded
+                shared[digest] = [memory, len(encoded), 0, []]
+            hashes[id(data)] = (data, digest)
+            shared[digest][3].append(data)
+        shared[digest][2] += 1
+        return digest
+
+    def release(digest):
+        block = shared[digest]
+        block[2] -= 1
+        if not block[2]:
+            del shared[digest]
+            for data in block[3]:
+                hashes.pop(id(data), None)
+            block[0].close()
+            block[0].unlink()
+
+    def finish(entry):
+        future, digests = entry
+        payloads = future.result()
+        for digest in digests:
+            release(digest)
+        return payloads
+
+    def chunks():
+        chunk = []
+        for myEmail in emails:
+            references = []
+            for attachment in myEmail.attachments:
+                digest = share(attachment.data)
+                memory, size = shared[digest][:2]
+                references.append((digest, (memory.name, size, getattr(attachment, 'name', None),
+                                            attachment.ext, attachment.content_type or attachment._mime_type)))
+            job = copy.copy(myEmail)
+            job.attachments = []
+            chunk.append((job, references))
+            if len(chunk) >= chunksize:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    pending = collections.deque()
+    try:
+        with futures.ProcessPoolExecutor(max_workers=workers) as executor:
+            window = 2 * (workers or os.cpu_count() or 1)
+            for chunk in chunks():
+                jobs = [(job, [reference for _, reference in references]) for job, references in chunk]
+                digests = [digest for _, references in chunk for digest, _ in references]
+                pending.append((executor.submit(_buildPayloadChunk, jobs), digests))
+                while len(pending) >= window:
+                    yield from finish(pending.popleft())
+            while pending:
+                yield from finish(pending.popleft())
+    finally:
+        for memory, size, users, data in shared.values():
+            memory.close()
+            memory.unlink()
+
+
+class _LazyField:
+    """Field of a LazyEmail decoded from the payload on first access"""
+
+    def __init__(self, slot, key: str, convert=None):
+        self.slot = slot
+        self.key = key
+        self.convert = convert
+
+    def __get__(self, obj, owner=None):
+        if obj is None:
+            return self
+        if self.key in obj._spans:
+            start, end = obj._spans.pop(self.key)
+            value = json.loads(obj._source[start:end])
+            self.slot.__set__(obj, self.convert(value) if self.convert else value)
+            if not obj._spans:
+                obj._source = None
+        return self.slot.__get__(obj)
+
+    def __set__(self, obj, value):
+        if obj._spans.pop(self.key, None) is not None and not obj._spans:
+            obj._source = None
+        self.slot.__set__(obj, value)
+
+
+class LazyEmail(Email):
+    """Email that imports webhook payloads lazily.
+    Headers are parsed by importEmail, the bodies and attachments are only decoded when accessed."""
+    __slots__ = ('_source', '_spans')
+
+    LAZY_KEYS = ('html_body', 'plain_body', 'attachments')
+
+    html = _LazyField(Email.html, 'html_body')
+    plain_text = _LazyField(Email.plain_text, 'plain_body')
+    attachments = _LazyField(Email.attachments, 'attachments', lambda value: importAttachments(value))
+
+    def __init__(self):
+        self._source = None
+        self._spans = {}
+        super().__init__()
+
+    def importEmail(self, jsonString):
+        if isinstance(jsonString, (bytes, bytearray)):
+            jsonString = jsonString.decode('utf-8')
+        data, spans = _scanObject(jsonString, self.LAZY_KEYS)
+        self._importHeaders(data)
+
+        if not data.get('attachment_quantity'):
+            spans.pop('attachments', None)
+        self._spans = spans
+        self._source = jsonString if spans else None
+
+    def isLoaded(self):
+        """Returns True once all lazy fields have been decoded"""
+        return not self._spans
+
+
+def _declaredType(content_type):
+    """Returns a declared MIME type, or None for generic types so the type is detected from the data"""
+    if content_type is None or content_type.strip().lower() in _GENERIC_TYPES:
+        return None
+    return content_type
+
+
+def importAttachments(attachments):
+    """Makes Attachment objects from the attachments of a Postal webhook payload"""
+    result = []
+    for attachment in attachments:
+        myAttachment = Attachment()
+        myAttachment.data = attachment['data']
+        myAttachment.name = attachment['filename'].split(".")[0]
+        myAttachment.ext = ".{}".format(attachment['filename'].split(".")[1])
+        result.append(myAttachment)
+    return result
+
+
+_JSON_WHITESPACE = json.decoder.WHITESPACE
+_JSON_STRUCTURE = r'["\[\]{}]'
+_JSON_DECODER = json.JSONDecoder()
+
+_REGEXES = {}
+
+
+def _regex(pattern: str):
+    """Returns the compiled pattern, compiling it on first use rather than at import"""
+    regex = _REGEXES.get(pattern)
+    if regex is None:
+        regex = _REGEXES[pattern] = re.compile(pattern)
+    return regex
+
+
+class _StreamReader:
+    """Incremental JSON reader over a file object, holding at most a few chunks of text"""
+
+    def __init__(self, fileobj, chunk_size: int):
+        self.fileobj = fileobj
+        self.chunk_size = chunk_size
+        self.decoder = codecs.getincrementaldecoder('utf-8')()
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+
+    def fill(self):
+        """Reads more text, at least doubling the unread buffer so large values are read in few passes"""
+        if self.eof:
+            raise json.JSONDecodeError("Unexpected end of stream", self.buffer, len(self.buffer))
+        chunk = self.fileobj.read(max(self.chunk_size, len(self.buffer) - self.pos))
+        if isinstance(chunk, (bytes, bytearray)):
+            text = self.decoder.decode(chunk, final=not chunk)
+        else:
+            text = chunk
+        self.eof = not chunk
+        self.buffer = self.buffer[self.pos:] + text
+        self.pos = 0
+
+    def peek(self):
+        """Skips whitespace and returns the next character, or '' at the end of the stream"""
+        while True:
+            self.pos = _JSON_WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer) or self.eof:
+                return self.buffer[self.pos:self.pos + 1]
+            self.fill()
+
+    def expect(self, char: str):
+        if self.peek() != char:
+            raise json.JSONDecodeError("Expecting '{}'".format(char), self.buffer, self.pos)
+        self.pos += 1
+
+    def readValue(self):
+        """Reads and decodes the next complete JSON value"""
+        self.peek()
+        while True:
+            try:
+                end = _skipValue(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+                self.fill()
+                continue
+            # A number may continue in the next chunk
+            if end < len(self.buffer) or self.eof:
+                value = json.loads(self.buffer[self.pos:end])
+                self.pos = end
+                return value
+            self.fill()
+
+    def readBase64(self, fileobj):
+        """Decodes the JSON string of base64 data at the current position into a binary file"""
+        self.expect('"')
+        carry = ''
+        while True:
+            end = self.buffer.find('"', self.pos)
+            while end != -1:
+                escape = end - 1
+                while escape >= self.pos and self.buffer[escape] == '\\':
+                    escape -= 1
+                if (end - escape) % 2:
+                    break
+                end = self.buffer.find('"', end + 1)
+
+            if end != -1:
+                cut = end
+            else:
+                # Do not split an escape sequence across chunks
+                cut = len(self.buffer)
+                escape = self.buffer.rfind('\\', max(self.pos, cut - 6))
+                if escape != -1:
+                    while escape > self.pos and self.buffer[escape - 1] == '\\':
+                        escape -= 1
+                    cut = escape
+
+            piece = self.buffer[self.pos:cut]
+            if '\\' in piece:
+                piece = json.loads('"' + piece + '"')
+            if '\n' in piece or '\r' in piece:
+                piece = ''.join(piece.split())
+            piece = carry + piece
+            usable = len(piece) - len(piece) % 4
+            fileobj.write(base64.b64decode(piece[:usable]))
+            carry = piece[usable:]
+            self.pos = cut
+
+            if end != -1:
+                self.pos = end + 1
+                if carry:
+                    fileobj.write(base64.b64decode(carry))
+                return
+            self.fill()
+
+
+def _skipString(text, pos):
+    """Returns the end of the JSON string starting at pos, found with str.find rather than decoding"""
+    end = pos
+    while True:
+        end = text.find('"', end + 1)
+        if end == -1:
+            raise json.JSONDecodeError("Unterminated string", text, pos)
+        escape = end - 1
+        while text[escape] == '\\':
+            escape -= 1
+        if (end - escape) % 2:
+            return end + 1
+
+
+def _skipValue(text, pos):
+    """Returns the end of the JSON value starting at pos without decoding it"""
+    char = text[pos:pos + 1]
+    if char == '"':
+        return _skipString(text, pos)
+    if char != '[' and char != '{':
+        return _JSON_DECODER.raw_decode(text, pos)[1]
+
+    search = _regex(_JSON_STRUCTURE).search
+    depth = 0
+    while True:
+        match = search(text, pos)
+        if match is None:
+            raise json.JSONDecodeError("Unterminated value", text, pos)
+        pos = match.start()
+        char = text[pos]
+        if char == '"':
+            pos = _skipString(text, pos)
+            continue
+        pos += 1
+        if char == '[' or char == '{':
+            depth += 1
+        else:
+            depth -= 1
+            if depth == 0:
+                return pos
+
+
+def _scanObject(text, lazyKeys):
+    """Decodes a JSON object, except for lazyKeys whose (start, end) spans are returned instead"""
+    values = {}
+    spans = {}
+
+    pos = _JSON_WHITESPACE.match(text, 0).end()
+    if text[pos:pos + 1] != '{':
+        raise json.JSONDecodeError("Expecting object", text, pos)
+    pos = _JSON_WHITESPACE.match(text, pos + 1).end()
+    if text[pos:pos + 1] == '}':
+        _expectEnd(text, pos + 1)
+        return values, spans
+
+    while True:
+        if text[pos:pos + 1] != '"':
+            raise json.JSONDecodeError("Expecting property name enclosed in double quotes", text, pos)
+        key, pos = json.decoder.scanstring(text, pos + 1)
+        pos = _JSON_WHITESPACE.match(text, pos).end()
+        if text[pos:pos + 1] != ':':
+            raise json.JSONDecodeError("Expecting ':' delimiter", text, pos)
+        pos = _JSON_WHITESPACE.match(text, pos + 1).end()
+
+        if key in lazyKeys:
+            end = _skipValue(text, pos)
+            spans[key] = (pos, end)
+        else:
+            values[key], end = _JSON_DECODER.raw_decode(text, pos)
+
+        pos = _JSON_WHITESPACE.match(text, end).end()
+        char = text[pos:pos + 1]
+        if char == '}':
+            _expectEnd(text, pos + 1)
+            return values, spans
+        if char != ',':
+            raise json.JSONDecodeError("Expecting ',' delimiter", text, pos)
+        pos = _JSON_WHITESPACE.match(text, pos + 1).end()
+
+
+def _expectEnd(text, pos):
+    """Raises like json.loads when anything but whitespace follows the value ending at pos"""
+    pos = _JSON_WHITESPACE.match(text, pos).end()
+    if pos != len(text):
+        raise json.JSONDecodeError("Extra data", text, pos)
+
+
+def _mimeBoundary():
+    return "=_{}".format(uuid.uuid4().hex)
+
+
+def _headerText(text):
+    """Replaces line breaks in a header value with spaces, so it can not end the header and add another one"""
+    if text and ('\r' in text or '\n' in text):
+        return _regex(r'[\r\n]+').sub(' ', text)
+    return text
+
+
+def _mimeHeader(text):
+    """Encodes a header value as an RFC 2047 encoded word when it is not plain ASCII, folded with CRLF"""
+    text = _headerText(text)
+    if text.isascii():
+        return text
+    return email.header.Header(text, 'utf-8').encode(linesep='\r\n')
+
+
+def _quoteName(name):
+    """Quotes a display name holding specials like email.utils.formataddr, without encoding non ASCII text"""
+    if name and _regex(r'[][\\()<>@,:;".]').search(name):
+        return '"{}"'.format(name.replace('\\', '\\\\').replace('"', '\\"'))
+    return name
+
+
+def _mimeAddress(addressee):
+    return email.utils.formataddr((_headerText(addressee.name), _headerText(addressee.email)), 'utf-8')
+
+
+def _writeMimeText(fileobj, subtype, text):
+    """Writes a text part, as 7bit when possible and base64 UTF-8 otherwise"""
+    text = text.replace('\r\n', '\n')
+    if text.isascii() and all(len(line) < 998 for line in text.split('\n')):
+        fileobj.write('Content-Type: text/{}; charset="us-ascii"\r\nContent-Transfer-Encoding: 7bit\r\n\r\n'.format(subtype).encode('ascii'))
+        fileobj.write(text.replace('\n', '\r\n').encode('ascii'))
+        fileobj.write(b'\r\n')
+    else:
+        fileobj.write('Content-Type: text/{}; charset="utf-8"\r\nContent-Transfer-Encoding: base64\r\n\r\n'.format(subtype).encode('ascii'))
+        fileobj.write(base64.encodebytes(text.encode('utf-8')).replace(b'\n', b'\r\n'))
+
+
+_ADDRESS_PATTERN = (
+    r'"([^"\\]*(?:\\.[^"\\]*)*)"'
+    r'|([a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+)'
+)
+_NAME_TABLE = str.maketrans('', '', ';:!*<>",')
+
+
+def parseAddresses(text):
+    """Parses a list of addresses such as a To header in a single scan.
+    The name of each address is the text since the previous one, quoted names are kept as written."""
+    addresses = []
+    name = ''
+    pos = 0
+
+    for match in _regex(_ADDRESS_PATTERN).finditer(text):
+        start, end = match.span()
+        quoted, address = match.groups()
+        if start > pos:
+            name += text[pos:start].translate(_NAME_TABLE)
+        pos = end
+
+        if address is None:
+            if '\\' in quoted:
+                quoted = re.sub(r'\\(.)', r'\1', quoted)
+            name += quoted
+        else:
+            addresses.append(Addressee(name.strip(), address))
+            name = ''
+
+    return addresses
+
 
 def cleanText(text):
     bad_chars = [';', ':', '!', "*", "<", ">", '"', ","]
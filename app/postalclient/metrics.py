@@ -0,0 +1,207 @@
+"""
+Timing hooks for the build, parse and send pipeline.
+
+Nothing is measured until a hook is added: the pipeline methods are only wrapped while at least
+one hook is registered, and the original methods are restored when the last one is removed.
+"""
+
+import functools
+import threading
+import time
+
+from . import client, main
+
+STAGES = (
+    (main.Email, "makeEmail"),
+    (main.Email, "to_json_bytes"),
+    (main.Email, "importEmail"),
+    (main.LazyEmail, "importEmail"),
+    (main.Email, "readSendFormat"),
+    (main.Attachment, "mimeType"),
+    (client.PostalClient, "send"),
+)
+"""Methods measured while hooks are registered. The stage name is the method name"""
+
+_hooks = []
+_originals = {}
+_lock = threading.Lock()
+_local = threading.local()
+"""Size of the last to_json_bytes result of the thread, reported as the size of send"""
+
+
+def addHook(hook):
+    """Registers hook(stage, seconds, size, attachments), called after every measured method, also when it raises.
+    size is the payload size in bytes when known: the JSON body for to_json_bytes and send, the text and
+    attachment data of the payload dict for makeEmail and readSendFormat. attachments is the number of
+    attachments of the email."""
+    with _lock:
+        if not _hooks:
+            _instrument()
+        _hooks.append(hook)
+    return hook
+
+
+def removeHook(hook):
+    with _lock:
+        _hooks.remove(hook)
+        if not _hooks:
+            _restore()
+
+
+def _emit(stage: str, seconds: float, size, attachments):
+    for hook in tuple(_hooks):
+        hook(stage, seconds, size, attachments)
+
+
+def _measure(stage: str, function):
+    @functools.wraps(function)
+    def measured(self, *args, **kwargs):
+        result = None
+        _local.size = None
+        start = time.perf_counter()
+        try:
+            result = function(self, *args, **kwargs)
+            return result
+        finally:
+            seconds = time.perf_counter() - start
+            size = None
+            if stage == "send":
+                # Encoded by the nested to_json_bytes call, which is measured as well
+                size = _local.size
+            elif isinstance(result, (bytes, bytearray)):
+                size = _local.size = len(result)
+            elif isinstance(result, dict):
+                size = _payloadSize(result)
+            elif args and isinstance(args[0], (str, bytes, bytearray)):
+                size = len(args[0])
+            elif args and isinstance(args[0], dict):
+                size = _payloadSize(args[0])
+
+            if isinstance(self, main.Email):
+                attachments = _attachmentCount(self)
+            elif args and isinstance(args[0], main.Email):
+                attachments = _attachmentCount(args[0])
+            else:
+                attachments = None
+            _emit(stage, seconds, size, attachments)
+    return measured
+
+
+def _payloadSize(data: dict):
+    """Length of the text and attachment data of a makeEmail payload, without the JSON syntax"""
+    size = 0
+    for value in data.values():
+        if isinstance(value, str):
+            size += len(value)
+        elif isinstance(value, list):
+            for item in value:
+                if isinstance(item, str):
+                    size += len(item)
+                elif isinstance(item, dict):
+                    size += sum(len(part) for part in item.values() if isinstance(part, str))
+    return size
+
+
+def _attachmentCount(email):
+    """Number of attachments, None while a LazyEmail has not decoded them"""
+    if isinstance(email, main.LazyEmail) and 'attachments' in email._spans:
+        return None
+    return len(email.attachments)
+
+
+def _instrument():
+    for cls, name in STAGES:
+        original = cls.__dict__[name]
+        _originals[(cls, name)] = original
+        setattr(cls, name, _measure(name, original))
+
+
+def _restore():
+    for (cls, name), original in _originals.items():
+        setattr(cls, name, original)
+    _originals.clear()
+
+
+class Histogram:
+    """In memory hook keeping a latency histogram, payload sizes and attachment counts per stage"""
+    buckets: tuple
+    """Upper bounds of the latency buckets in seconds"""
+
+    def __init__(self, buckets: tuple = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5)):
+        self.buckets = buckets
+        self.stages = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, stage: str, seconds: float, size, attachments):
+        with self._lock:
+            stats = self.stages.get(stage)
+            if stats is None:
+                stats = self.stages[stage] = {"count": 0, "seconds": 0.0, "sized": 0, "bytes": 0, "attachments": 0,
+                                              "buckets": [0] * (len(self.buckets) + 1)}
+            stats["count"] += 1
+            stats["seconds"] += seconds
+            if size is not None:
+                stats["sized"] += 1
+                stats["bytes"] += size
+            stats["attachments"] += attachments or 0
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    break
+            else:
+                i = len(self.buckets)
+            stats["buckets"][i] += 1
+
+    def summary(self):
+        """Returns count, mean latency, mean payload size, total attachments and bucket counts per stage"""
+        with self._lock:
+            return {stage: {"count": stats["count"],
+                            "mean_seconds": stats["seconds"] / stats["count"],
+                            "mean_bytes": stats["bytes"] / stats["sized"] if stats["sized"] else None,
+                            "attachments": stats["attachments"],
+                            "buckets": dict(zip(self.buckets + (float("inf"),), stats["buckets"]))}
+                    for stage, stats in self.stages.items()}
+
+
+class PrometheusHook:
+    """Hook recording to prometheus_client histograms labelled by stage"""
+
+    def __init__(self, registry=None, prefix: str = "postal"):
+        from prometheus_client import REGISTRY, Histogram as PrometheusHistogram
+
+        registry = registry or REGISTRY
+        self.latency = PrometheusHistogram(prefix + "_stage_seconds", "Time spent per pipeline stage",
+                                           ["stage"], registry=registry)
+        self.size = PrometheusHistogram(prefix + "_payload_bytes", "Payload size per pipeline stage", ["stage"],
+                                        buckets=(1e3, 1e4, 1e5, 1e6, 1e7, 5e7), registry=registry)
+        self.attachments = PrometheusHistogram(prefix + "_attachments", "Attachments per email", ["stage"],
+                                               buckets=(0, 1, 2, 5, 10, 20), registry=registry)
+
+    def __call__(self, stage: str, seconds: float, size, attachments):
+        self.latency.labels(stage).observe(seconds)
+        if size is not None:
+            self.size.labels(stage).observe(size)
+        if attachments is not None:
+            self.attachments.labels(stage).observe(attachments)
+
+
+class OpenTelemetryHook:
+    """Hook recording to OpenTelemetry histograms with a stage attribute"""
+
+    def __init__(self, meter=None):
+        if meter is None:
+            from opentelemetry import metrics
+
+            meter = metrics.get_meter("postalclient")
+        self.latency = meter.create_histogram("postal.stage.duration", unit="s",
+                                              description="Time spent per pipeline stage")
+        self.size = meter.create_histogram("postal.payload.size", unit="By",
+                                           description="Payload size per pipeline stage")
+        self.attachments = meter.create_histogram("postal.attachments", description="Attachments per email")
+
+    def __call__(self, stage: str, seconds: float, size, attachments):
+        attributes = {"stage": stage}
+        self.latency.record(seconds, attributes)
+        if size is not None:
+            self.size.record(size, attributes)
+        if attachments is not None:
+            self.attachments.record(attachments, attributes)
@@ -0,0 +1,243 @@
+"""
+Durable outbound queue, spooling emails to SQLite until they are accepted by Postal.
+"""
+
+import json
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+
+from concurrent.futures import ThreadPoolExecutor
+
+from .client import NO_RESPONSE, NOT_SENT, PostalError
+
+logger = logging.getLogger(__name__)
+
+
+class Outbox:
+    """Queue of outgoing emails stored in a SQLite database and drained by a pool of background workers.
+    Every email has an idempotency key, so enqueueing the same key twice sends it once,
+    and emails survive restarts until Postal has accepted them.
+    An email that was sent without an answer may have been accepted, so it is marked as unknown
+    instead of being sent again. Use requeue() to send it again once it is known to be missing."""
+    path: str
+    """Path of the SQLite database"""
+    client: object
+    """PostalClient used to send the emails"""
+    workers: int
+    """Number of emails sent concurrently"""
+    batch_size: int
+    """Number of emails claimed from the queue at a time"""
+    max_attempts: int
+    """Attempts before an email is marked as failed"""
+    retry_delay: float
+    """Seconds before retrying an email after a temporary error, doubled on every attempt"""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS outbox (
+            id INTEGER PRIMARY KEY,
+            key TEXT NOT NULL UNIQUE,
+            payload BLOB NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt REAL NOT NULL DEFAULT 0,
+            message_id TEXT,
+            error TEXT,
+            created REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS outbox_pending ON outbox (status, next_attempt);
+    """
+
+    def __init__(self, path: str, client, workers: int = 4, batch_size: int = 50,
+                 max_attempts: int = 5, retry_delay: float = 30):
+        """Opens or creates the queue. Emails left in flight by a previous run are queued again"""
+        self.path = path
+        self.client = client
+        self.workers = workers
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+
+        self._local = threading.local()
+        self._wakeup = threading.Event()
+        self._idle = threading.Condition()
+        self._stopping = threading.Event()
+        self._thread = None
+
+        connection = self._connection()
+        connection.executescript(self.SCHEMA)
+        with connection:
+            connection.execute("UPDATE outbox SET status = 'pending' WHERE status = 'sending'")
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _connection(self):
+        """Returns the SQLite connection of the calling thread"""
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def enqueue(self, email, key: str = None):
+        """Adds an Email, or a makeEmail payload, to the queue and returns its idempotency key"""
+        return self.enqueue_many([email], [key] if key else None)[0]
+
+    def enqueue_many(self, emails, keys: list = None):
+        """Adds many emails in one transaction and returns their idempotency keys"""
+        rows = []
+        now = time.time()
+        for i, email in enumerate(emails):
+            payload = json.dumps(email).encode("utf-8") if isinstance(email, dict) else email.to_json_bytes()
+            key = keys[i] if keys else uuid.uuid4().hex
+            rows.append((key, payload, now))
+
+        connection = self._connection()
+        with connection:
+            connection.execute("BEGIN")
+            connection.executemany(
+                "INSERT OR IGNORE INTO outbox (key, payload, created) VALUES (?, ?, ?)", rows)
+        self._wakeup.set()
+        return [row[0] for row in rows]
+
+    def status(self, key: str):
+        """Returns (status, message_id, error) of a queued email, None if the key is unknown.
+        status is pending, sending, sent, failed or unknown"""
+        return self._connection().execute(
+            "SELECT status, message_id, error FROM outbox WHERE key = ?", (key,)).fetchone()
+
+    def requeue(self, key: str):
+        """Queues a failed or unknown email to be sent again. Returns False if there is no such email"""
+        connection = self._connection()
+        with connection:
+            changed = connection.execute(
+                "UPDATE outbox SET status = 'pending', next_attempt = 0 "
+                "WHERE key = ? AND status IN ('failed', 'unknown')", (key,)).rowcount
+        self._wakeup.set()
+        return changed > 0
+
+    def counts(self):
+        """Returns the number of emails in every status"""
+        return dict(self._connection().execute("SELECT status, COUNT(*) FROM outbox GROUP BY status"))
+
+    def start(self):
+        """Starts draining the queue in the background"""
+        if self._thread is None:
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name="postal-outbox", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = None):
+        """Stops the background workers after the batch in flight"""
+        if self._thread is not None:
+            self._stopping.set()
+            self._wakeup.set()
+            self._thread.join(timeout)
+            self._thread = None
+
+    def flush(self, timeout: float = None):
+        """Waits until no email is waiting to be sent. Returns False on timeout.
+        Raises RuntimeError if the queue is not being drained, as it would never empty"""
+        self._wakeup.set()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._idle:
+            while self._unsent():
+                if self._thread is None or not self._thread.is_alive():
+                    raise RuntimeError("Outbox is not running, call start() first")
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._idle.wait(min(remaining, 1) if remaining is not None else 1)
+        return True
+
+    def _unsent(self):
+        return self._connection().execute(
+            "SELECT COUNT(*) FROM outbox WHERE status IN ('pending', 'sending')").fetchone()[0]
+
+    def _claim(self):
+        """Marks the next batch of due emails as sending and returns them"""
+        connection = self._connection()
+        with connection:
+            connection.execute("BEGIN IMMEDIATE")
+            rows = connection.execute(
+                "SELECT id, payload, attempts FROM outbox WHERE status = 'pending' AND next_attempt <= ? "
+                "ORDER BY id LIMIT ?", (time.time(), self.batch_size)).fetchall()
+            connection.executemany("UPDATE outbox SET status = 'sending' WHERE id = ?",
+                                   [(row[0],) for row in rows])
+        return rows
+
+    def _nextDue(self):
+        row = self._connection().execute(
+            "SELECT MIN(next_attempt) FROM outbox WHERE status = 'pending'").fetchone()
+        return row[0]
+
+    def _send(self, row):
+        id, payload, attempts = row
+        try:
+            if isinstance(payload, str):
+                payload = payload.encode("utf-8")
+            data = self.client.request("/api/v1/send/message", payload)
+            return id, attempts, data.get("message_id"), None
+        except PostalError as e:
+            return id, attempts, None, e
+        except Exception as e:
+            # Whether the email went out is not known, so it must not be sent again blindly
+            return id, attempts, None, PostalError(str(e), NO_RESPONSE)
+
+    def _record(self, results):
+        """Stores the outcome of a batch in one transaction"""
+        updates = []
+        now = time.time()
+        for id, attempts, message_id, error in results:
+            attempts += 1
+            if error is None:
+                updates.append(("sent", attempts, 0, message_id, None, id))
+            elif error.code == NO_RESPONSE:
+                updates.append(("unknown", attempts, 0, None, str(error), id))
+            elif (error.code == NOT_SENT or error.status in self.client.RETRY_STATUS) and attempts < self.max_attempts:
+                delay = self.retry_delay * (2 ** (attempts - 1))
+                updates.append(("pending", attempts, now + delay, None, str(error), id))
+            else:
+                updates.append(("failed", attempts, 0, None, str(error), id))
+
+        connection = self._connection()
+        with connection:
+            connection.execute("BEGIN")
+            connection.executemany(
+                "UPDATE outbox SET status = ?, attempts = ?, next_attempt = ?, message_id = ?, error = ? "
+                "WHERE id = ?", updates)
+
+    def _run(self):
+        results = None
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            while not self._stopping.is_set():
+                try:
+                    if results is not None:
+                        # Outcome of a batch that could not be stored, the emails must not be sent again
+                        self._record(results)
+                        results = None
+
+                    self._wakeup.clear()
+                    rows = self._claim()
+                    if rows:
+                        results = list(executor.map(self._send, rows))
+                        self._record(results)
+                        results = None
+                        continue
+
+                    with self._idle:
+                        self._idle.notify_all()
+                    due = self._nextDue()
+                    self._wakeup.wait(1 if due is None else min(max(due - time.time(), 0.01), 1))
+                except Exception:
+                    logger.exception("Postal outbox worker failed, retrying")
+                    self._stopping.wait(1)
@@ -0,0 +1,143 @@
+"""
+Rate limiting for sending to Postal, with token buckets and adaptive concurrency.
+"""
+
+import collections
+import threading
+import time
+
+
+class TokenBucket:
+    """Allows rate requests per second on average, with bursts of up to burst requests"""
+    rate: float
+    """Tokens added per second"""
+    burst: float
+    """Most tokens the bucket holds"""
+
+    def __init__(self, rate: float, burst: float = None):
+        self.rate = rate
+        self.burst = burst or max(1.0, rate)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+
+    def delay(self, now: float):
+        """Returns the seconds until a token is available, 0 if one is available now"""
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+
+class RateLimiter:
+    """Limits requests to a Postal server with a token bucket for the server and one per recipient domain.
+    The number of requests in flight adapts to the server: it halves on a 429 response or when the smoothed
+    latency is above target_latency, and otherwise grows by 1 / concurrency for every successful request,
+    so by about one request once as many requests as the current limit have succeeded."""
+    concurrency: float
+    """Current limit of requests in flight"""
+    min_concurrency: int
+    max_concurrency: int
+    target_latency: float
+    """Latency in seconds above which concurrency is reduced"""
+
+    def __init__(self, rate: float = None, burst: float = None, domain_rate: float = None,
+                 domain_rates: dict = None, min_concurrency: int = 1, max_concurrency: int = 32,
+                 target_latency: float = 2.0, window: float = 10.0):
+        """Make a limiter. rate limits requests per second to the server, domain_rate limits the
+        requests per second for every recipient domain, domain_rates overrides it for some domains.
+        window is the period in seconds over which stats() measures the send rate"""
+        self.bucket = TokenBucket(rate, burst) if rate else None
+        self.domain_rate = domain_rate
+        self.domain_rates = domain_rates or {}
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.concurrency = float(max_concurrency)
+        self.target_latency = target_latency
+        self.window = window
+
+        self.in_flight = 0
+        self.waiting = 0
+        self.throttled = 0
+        self._domains = {}
+        self._completed = collections.deque()
+        self._latency = None
+        self._condition = threading.Condition()
+
+    def _domainBucket(self, domain: str):
+        bucket = self._domains.get(domain)
+        if bucket is None:
+            rate = self.domain_rates.get(domain, self.domain_rate)
+            if not rate:
+                return None
+            bucket = self._domains[domain] = TokenBucket(rate)
+        return bucket
+
+    def acquire(self, domains=()):
+        """Blocks until a request to the given recipient domains may start. Returns the start time for release"""
+        with self._condition:
+            self.waiting += 1
+            try:
+                while True:
+                    if self.in_flight >= int(self.concurrency):
+                        self._condition.wait()
+                        continue
+
+                    now = time.monotonic()
+                    buckets = [self._domainBucket(domain) for domain in domains]
+                    buckets = [bucket for bucket in buckets if bucket is not None]
+                    if self.bucket is not None:
+                        buckets.append(self.bucket)
+
+                    delay = max([bucket.delay(now) for bucket in buckets] or [0])
+                    if delay > 0:
+                        self._condition.wait(delay)
+                        continue
+
+                    for bucket in buckets:
+                        bucket.take()
+                    self.in_flight += 1
+                    return now
+            finally:
+                self.waiting -= 1
+
+    def release(self, started: float, status: int = None):
+        """Records the end of a request started by acquire, with its HTTP status if one was received"""
+        now = time.monotonic()
+        latency = now - started
+        with self._condition:
+            self.in_flight -= 1
+            self._latency = latency if self._latency is None else self._latency * 0.8 + latency * 0.2
+
+            if status == 429:
+                self.throttled += 1
+                self.concurrency = max(self.min_concurrency, self.concurrency / 2)
+            elif status is not None and status < 500:
+                self._completed.append(now)
+                if self._latency > self.target_latency:
+                    self.concurrency = max(self.min_concurrency, self.concurrency / 2)
+                    self._latency = None
+                else:
+                    self.concurrency = min(self.max_concurrency, self.concurrency + 1 / self.concurrency)
+
+            while self._completed and self._completed[0] < now - self.window:
+                self._completed.popleft()
+            self._condition.notify_all()
+
+    def stats(self):
+        """Returns the current send rate per second, requests in flight and waiting, and the concurrency limit"""
+        with self._condition:
+            now = time.monotonic()
+            while self._completed and self._completed[0] < now - self.window:
+                self._completed.popleft()
+            return {
+                "rate": len(self._completed) / self.window,
+                "in_flight": self.in_flight,
+                "queue_depth": self.waiting,
+                "concurrency": int(self.concurrency),
+                "latency": self._latency,
+                "throttled": self.throttled,
+            }
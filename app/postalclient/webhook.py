@@ -0,0 +1,206 @@
+"""
+ASGI receiver for Postal webhooks and inbound messages.
+"""
+
+import asyncio
+import base64
+import json
+import logging
+
+from concurrent.futures import ThreadPoolExecutor
+
+from .main import LazyEmail, _scanObject
+
+logger = logging.getLogger(__name__)
+
+INBOUND = "MessageReceived"
+"""Event type of messages posted to an HTTP route endpoint, which carry no event field"""
+
+
+class WebhookReceiver:
+    """ASGI application receiving Postal webhooks.
+    Requests are verified and acknowledged at once, then parsed and handed to the handlers registered for
+    their event type by a bounded pool of workers. When the queue is full requests are answered with 503,
+    so Postal retries them later."""
+    public_key: object
+    """Postal signing key used to verify requests, None to accept unsigned requests"""
+    workers: int
+    """Number of events parsed and handled at the same time"""
+    queue_size: int
+    """Number of acknowledged events waiting for a worker"""
+    max_body: int
+    """Largest accepted request body in bytes"""
+    received: int
+    """Number of events acknowledged"""
+    rejected: int
+    """Number of requests refused for a bad signature, size or full queue"""
+    handled: int
+    """Number of events handled"""
+    failed: int
+    """Number of events whose parsing or handler raised"""
+
+    def __init__(self, public_key: str = None, workers: int = 4, queue_size: int = 1000,
+                 max_body: int = 64 * 1024 * 1024):
+        """Make a receiver. public_key is the PEM or base64 DER key shown in the Postal server settings,
+        verifying it requires the cryptography package"""
+        self.public_key = _loadPublicKey(public_key) if public_key else None
+        self.workers = workers
+        self.queue_size = queue_size
+        self.max_body = max_body
+        self.received = 0
+        self.rejected = 0
+        self.handled = 0
+        self.failed = 0
+
+        self._handlers = {}
+        self._queue = None
+        self._tasks = []
+        self._executor = None
+
+    def on(self, event: str):
+        """Decorator registering a handler for an event type such as MessageSent, or INBOUND.
+        Handlers receive the event payload dict, or a LazyEmail for inbound messages, and may be coroutines."""
+        def register(handler):
+            self._handlers.setdefault(event, []).append(handler)
+            return handler
+        return register
+
+    async def start(self):
+        """Starts the workers. Called on ASGI lifespan startup, or on the first request"""
+        if self._queue is None:
+            self._queue = asyncio.Queue(self.queue_size)
+            self._executor = ThreadPoolExecutor(max_workers=self.workers)
+            self._tasks = [asyncio.ensure_future(self._work()) for _ in range(self.workers)]
+
+    async def stop(self):
+        """Waits for queued events to be handled and stops the workers"""
+        if self._queue is not None:
+            await self._queue.join()
+            for task in self._tasks:
+                task.cancel()
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+            self._executor.shutdown()
+            self._queue = None
+            self._tasks = []
+
+    async def join(self):
+        """Waits until every acknowledged event has been handled"""
+        if self._queue is not None:
+            await self._queue.join()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            return
+
+        if scope["method"] != "POST":
+            await _respond(send, 405)
+            return
+        await self.start()
+
+        body = bytearray()
+        more = True
+        while more:
+            message = await receive()
+            body += message.get("body", b"")
+            more = message.get("more_body", False)
+            if len(body) > self.max_body:
+                self.rejected += 1
+                await _respond(send, 413)
+                return
+        body = bytes(body)
+
+        if self.public_key is not None and not self.verify(body, dict(scope.get("headers", []))):
+            self.rejected += 1
+            await _respond(send, 401)
+            return
+
+        try:
+            self._queue.put_nowait(body)
+        except asyncio.QueueFull:
+            self.rejected += 1
+            await _respond(send, 503, [(b"retry-after", b"5")])
+            return
+        self.received += 1
+        await _respond(send, 200)
+
+    def verify(self, body: bytes, headers: dict):
+        """Checks the X-Postal-Signature-256 or X-Postal-Signature header of a request.
+        headers maps lower case header names to values, as bytes"""
+        from cryptography.exceptions import InvalidSignature
+        from cryptography.hazmat.primitives import hashes
+        from cryptography.hazmat.primitives.asymmetric import padding
+
+        signature = headers.get(b"x-postal-signature-256")
+        algorithm = hashes.SHA256()
+        if signature is None:
+            signature = headers.get(b"x-postal-signature")
+            algorithm = hashes.SHA1()
+        if signature is None:
+            return False
+        try:
+            self.public_key.verify(base64.b64decode(signature), body, padding.PKCS1v15(), algorithm)
+        except (InvalidSignature, ValueError):
+            return False
+        return True
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await self.start()
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await self.stop()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def _work(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            body = await self._queue.get()
+            try:
+                event, payload = await loop.run_in_executor(self._executor, _parse, body)
+                for handler in self._handlers.get(event, ()):
+                    if asyncio.iscoroutinefunction(handler):
+                        await handler(payload)
+                    else:
+                        await loop.run_in_executor(self._executor, handler, payload)
+                self.handled += 1
+            except Exception:
+                self.failed += 1
+                logger.exception("Postal webhook handler failed")
+            finally:
+                self._queue.task_done()
+
+
+def _parse(body: bytes):
+    """Returns the event type and payload of a webhook body"""
+    text = body.decode("utf-8")
+    values, spans = _scanObject(text, ("payload",) + LazyEmail.LAZY_KEYS)
+    if "event" in values:
+        payload = {}
+        if "payload" in spans:
+            start, end = spans["payload"]
+            payload = json.loads(text[start:end])
+        return values["event"], payload
+
+    myEmail = LazyEmail()
+    myEmail.importEmail(text)
+    return INBOUND, myEmail
+
+
+def _loadPublicKey(key: str):
+    from cryptography.hazmat.primitives import serialization
+
+    if key.lstrip().startswith("-----BEGIN"):
+        return serialization.load_pem_public_key(key.encode("ascii"))
+    return serialization.load_der_public_key(base64.b64decode(key))
+
+
+async def _respond(send, status: int, headers: list = None):
+    await send({"type": "http.response.start", "status": status,
+                "headers": [(b"content-type", b"text/plain"), (b"content-length", b"0")] + (headers or [])})
+    await send({"type": "http.response.body", "body": b""})
@@ -0,0 +1,144 @@
+"""
+LazyEmail and the JSON scanner it shares with the webhook receiver and load_columns.
+
+Run from the app directory: python -m pytest tests
+"""
+
+import base64
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from postalclient.main import Email, LazyEmail, _scanObject, _skipValue
+
+VALUES = (
+    '"plain"',
+    '"quote \\" inside"',
+    '"ends with backslash \\\\"',
+    '"\\\\\\""',
+    '"braces { [ in a string ] }"',
+    '"caf\\u00e9 é"',
+    '12.5e3',
+    '-0',
+    'true',
+    'null',
+    '[]',
+    '{}',
+    '[1, "]", {"a": "}"}, [[]], null]',
+    '{"a": {"b": ["\\"}", 2]}, "c": "\\\\"}',
+)
+
+MALFORMED = (
+    '',
+    '[]',
+    '{',
+    '{"a" 1}',
+    '{"a": 1,}',
+    '{"a": 1',
+    '{a: 1}',
+    '{"a": 1 "b": 2}',
+    '{"html_body": "unterminated',
+    '{"html_body": [1, 2',
+    '{"a": 1} trailing',
+)
+
+
+def makePayload(attachments=()):
+    return json.dumps({
+        "id": 3,
+        "from": "Billing <billing@example.com>",
+        "to": "Support <support@example.com>",
+        "cc": None,
+        "date": "Mon, 1 Jan 2024 10:00:00 +0000",
+        "subject": "Invoice \"3\" {draft}",
+        "plain_body": "Hello }\n\\ world",
+        "html_body": "<p>Hello</p>",
+        "attachment_quantity": len(attachments),
+        "attachments": [{"filename": name, "data": base64.b64encode(data).decode('ascii')}
+                        for name, data in attachments],
+    })
+
+
+def summary(email):
+    return {
+        'sender': (email.sender.name, email.sender.email),
+        'to': [(person.name, person.email) for person in email.reciever],
+        'subject': email.subject,
+        'plain_text': email.plain_text,
+        'html': email.html,
+        'extra': email.extra,
+        'attachments': [(attachment.name, attachment.ext, attachment.data) for attachment in email.attachments],
+    }
+
+
+@pytest.mark.parametrize('value', VALUES)
+def test_skipValue_finds_the_end(value):
+    text = '{"key": ' + value + ' , "next": 1}'
+    start = text.index(':') + 2
+    end = _skipValue(text, start)
+    assert text[start:end] == value
+    assert json.loads(text[start:end]) == json.loads(value)
+
+
+def test_scanObject_matches_json_loads():
+    text = '{' + ', '.join('"k{}": {}'.format(i, value) for i, value in enumerate(VALUES)) + '}'
+    lazy = ('k0', 'k4', 'k12', 'k13')
+    values, spans = _scanObject(text, lazy)
+    expected = json.loads(text)
+    assert set(spans) == set(lazy)
+    for key, (start, end) in spans.items():
+        assert json.loads(text[start:end]) == expected.pop(key)
+    assert values == expected
+
+
+@pytest.mark.parametrize('text', MALFORMED)
+def test_scanObject_rejects_malformed_json(text):
+    with pytest.raises(json.JSONDecodeError):
+        _scanObject(text, LazyEmail.LAZY_KEYS)
+
+
+@pytest.mark.parametrize('attachments', [(), (("invoice.pdf", b'%PDF-1.4\n' + bytes(300)), ("a.txt", b'a'))])
+def test_lazy_matches_eager(attachments):
+    payload = makePayload(attachments)
+    eager = Email()
+    eager.importEmail(payload)
+    lazy = LazyEmail()
+    lazy.importEmail(payload.encode('utf-8'))
+    assert summary(lazy) == summary(eager)
+
+
+def test_isLoaded_after_every_lazy_field():
+    lazy = LazyEmail()
+    lazy.importEmail(makePayload([("invoice.pdf", b'%PDF-1.4\n')]))
+    assert not lazy.isLoaded()
+    lazy.html
+    assert not lazy.isLoaded()
+    lazy.plain_text
+    assert not lazy.isLoaded()
+    assert len(lazy.attachments) == 1
+    assert lazy.isLoaded()
+    assert lazy._source is None
+
+
+def test_isLoaded_without_attachments_and_after_assignment():
+    lazy = LazyEmail()
+    lazy.importEmail(makePayload())
+    lazy.plain_text
+    assert not lazy.isLoaded()
+    lazy.html = '<p>Replaced</p>'
+    assert lazy.isLoaded()
+    assert lazy.html == '<p>Replaced</p>'
+    assert lazy.attachments == []
+
+
+def test_malformed_lazy_field_raises_on_access():
+    payload = makePayload().replace('"<p>Hello</p>"', '{"a" 1}')
+    lazy = LazyEmail()
+    lazy.importEmail(payload)
+    assert lazy.subject == 'Invoice "3" {draft}'
+    with pytest.raises(json.JSONDecodeError):
+        lazy.html
@@ -0,0 +1,105 @@
+"""
+Outbox retry and recovery, run offline against the stub Postal server of the benchmarks.
+
+Run from the app directory: python -m pytest tests
+"""
+
+import os
+import sqlite3
+import sys
+
+import pytest
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+sys.path.insert(0, os.path.join(APP_DIR, 'benchmarks'))
+
+from postalclient.client import PostalClient
+from postalclient.outbox import Outbox
+from stub import StubServer
+
+PAYLOAD = {"to": ["person@example.com"], "from": "sender@example.com", "subject": "Report"}
+
+
+@pytest.fixture
+def server():
+    with StubServer() as server:
+        yield server
+
+
+def makeOutbox(tmp_path, server, **kwargs):
+    client = PostalClient(server.url, "key", retries=0, timeout=kwargs.pop('timeout', 5))
+    return Outbox(str(tmp_path / "outbox.db"), client, retry_delay=0.01, **kwargs)
+
+
+def test_retries_unavailable_server(tmp_path, server):
+    server.fail = 2
+    with makeOutbox(tmp_path, server) as outbox:
+        key = outbox.enqueue(PAYLOAD)
+        assert outbox.flush(10)
+        status, message_id, error = outbox.status(key)
+    assert status == 'sent' and message_id
+    assert server.received == 3
+
+
+def test_fails_after_max_attempts(tmp_path, server):
+    server.fail = 10
+    with makeOutbox(tmp_path, server, max_attempts=3) as outbox:
+        key = outbox.enqueue(PAYLOAD)
+        assert outbox.flush(10)
+        assert outbox.status(key)[0] == 'failed'
+    assert server.received == 3
+
+
+def test_unanswered_email_is_not_sent_again(tmp_path, server):
+    server.delay = 0.5
+    with makeOutbox(tmp_path, server, timeout=0.2) as outbox:
+        key = outbox.enqueue(PAYLOAD)
+        assert outbox.flush(10)
+        assert outbox.status(key)[0] == 'unknown'
+        assert server.received == 1
+
+        server.delay = 0
+        assert outbox.requeue(key)
+        assert outbox.flush(10)
+        assert outbox.status(key)[0] == 'sent'
+    assert server.received == 2
+
+
+def test_requeues_emails_left_sending_by_a_crash(tmp_path, server):
+    outbox = makeOutbox(tmp_path, server)
+    key = outbox.enqueue(PAYLOAD)
+    # Claimed by a worker that died before sending
+    assert len(outbox._claim()) == 1
+    assert outbox.status(key)[0] == 'sending'
+
+    with makeOutbox(tmp_path, server) as restarted:
+        assert restarted.flush(10)
+        assert restarted.status(key)[0] == 'sent'
+    assert server.received == 1
+
+
+def test_worker_survives_database_errors(tmp_path, server):
+    with makeOutbox(tmp_path, server) as outbox:
+        record = outbox._record
+        calls = []
+
+        def failOnce(results):
+            calls.append(results)
+            if len(calls) == 1:
+                raise sqlite3.OperationalError("database is locked")
+            record(results)
+
+        outbox._record = failOnce
+        key = outbox.enqueue(PAYLOAD)
+        assert outbox.flush(10)
+        assert outbox.status(key)[0] == 'sent'
+    assert len(calls) == 2
+    assert server.received == 1
+
+
+def test_flush_without_workers_raises(tmp_path, server):
+    outbox = makeOutbox(tmp_path, server)
+    outbox.enqueue(PAYLOAD)
+    with pytest.raises(RuntimeError):
+        outbox.flush()
@@ -0,0 +1,56 @@
+"""
+MIME type detection of attachment data.
+
+Run from the app directory: python -m pytest tests
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from postalclient import main
+from postalclient.main import sniffMimeType
+
+PROSE = (
+    b"Dear John, thanks for the report\nBest regards, Bob\n",
+    b"Hi all,\nthe meeting moved to 3pm, room 2.\nSee you there, Anna\n",
+    b"Thanks, that works for me\nCheers, Tom\nSent from my phone, sorry for any typos\n",
+)
+
+TABLES = (
+    b"name,email,amount\nAnna,anna@example.com,12.50\nTom,tom@example.com,7\n",
+    b'id,city,note\n1,New York,"Paid, thanks."\n2,Berlin,late\n3,Paris,\n',
+    b"id,name,notes\n1,Anna,Paid in full by card\n2,Tom,Refund requested. Call back!\n3,Li,\n",
+    b"sku,product,price\n1001,Acme Inc. widget,9.99\n1002,Acme Inc. gadget,19.99\n",
+    b"name,amount\nAnna,12.50\n",
+    b'name,address\nAnna,"1 Main St\nSpringfield"\nTom,"2 High St, Leeds"\n',
+)
+
+
+@pytest.mark.parametrize('head, mime_type', [
+    (b'%PDF-1.4\n', 'application/pdf'),
+    (b'\x89PNG\r\n\x1a\n\x00\x00', 'image/png'),
+    (b'\xff\xd8\xff\xe0\x00\x10JFIF', 'image/jpeg'),
+    (b'BEGIN:VCALENDAR\r\nVERSION:2.0\r\n', 'text/calendar'),
+])
+def test_signatures(head, mime_type):
+    assert sniffMimeType(head) == mime_type
+
+
+@pytest.mark.parametrize('head', PROSE)
+def test_prose_is_not_csv(head):
+    assert sniffMimeType(head) != 'text/csv'
+
+
+@pytest.mark.parametrize('head', TABLES)
+def test_tables_are_csv(head):
+    assert sniffMimeType(head) == 'text/csv'
+
+
+@pytest.mark.parametrize('head', TABLES)
+def test_tables_are_csv_without_libmagic(head, monkeypatch):
+    monkeypatch.setattr(main, 'magic', None)
+    assert sniffMimeType(head) == 'text/csv'
@@ -0,0 +1,125 @@
+"""
+Round trips through the store format and the send format.
+
+Run from the app directory: python -m pytest tests
+"""
+
+import base64
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from postalclient.main import STORE_MAGIC, Addressee, Attachment, Email
+
+PDF = b'%PDF-1.4\n' + bytes(range(256)) * 20
+
+
+def makeEmail(tmp_path):
+    email = Email()
+    email.sender = Addressee('Billing', 'billing@example.com')
+    email.rply_to = Addressee('Support', 'support@example.com')
+    email.addReciever(Addressee('Doe, John', 'john@example.org'))
+    email.addReciever(Addressee('Anna', 'anna@example.org'))
+    email.addCC(Addressee('Copy', 'copy@example.net'))
+    email.addBCC(Addressee('Hidden', 'hidden@example.net'))
+    email.subject = 'Invoice – März'
+    email.plain_text = 'Hello\nWorld ✓'
+    email.html = '<p>Hello</p>'
+    email.tag = 'invoices'
+
+    attachment = Attachment('invoice')
+    attachment.data = base64.b64encode(PDF).decode('ascii')
+    email.attachments.append(attachment)
+
+    path = tmp_path / 'notes.txt'
+    path.write_bytes(b'first line\nsecond line\n')
+    email.attachments.append(Attachment.from_path(str(path)))
+    return email
+
+
+def people(addressees):
+    return [(person.name, person.email) for person in addressees]
+
+
+def assertSameHeaders(copy, email):
+    assert (copy.sender.name, copy.sender.email) == (email.sender.name, email.sender.email)
+    assert (copy.rply_to.name, copy.rply_to.email) == (email.rply_to.name, email.rply_to.email)
+    assert people(copy.reciever) == people(email.reciever)
+    assert people(copy.cc) == people(email.cc)
+    assert people(copy.bcc) == people(email.bcc)
+    assert copy.subject == email.subject
+    assert copy.tag == email.tag
+
+
+def assertSameAttachments(copy, email):
+    assert [attachment.fileName() for attachment in copy.attachments] == \
+        [attachment.fileName() for attachment in email.attachments]
+    assert [base64.b64decode(attachment.data) for attachment in copy.attachments] == \
+        [base64.b64decode(attachment.data) for attachment in email.attachments]
+
+
+def test_round_trip_from_bytes(tmp_path):
+    email = makeEmail(tmp_path)
+    stored = email.to_store()
+    assert stored.startswith(STORE_MAGIC)
+
+    copy = Email.from_store(stored)
+    assertSameHeaders(copy, email)
+    assert copy.plain_text == email.plain_text
+    assert copy.html == email.html
+    assertSameAttachments(copy, email)
+
+
+def test_round_trip_from_path(tmp_path):
+    email = makeEmail(tmp_path)
+    path = str(tmp_path / 'message.store')
+    email.to_store(path)
+
+    copy = Email.from_store(path)
+    assertSameHeaders(copy, email)
+    assert copy.plain_text == email.plain_text
+    assert copy.html == email.html
+    assertSameAttachments(copy, email)
+    assert copy.attachments[0].mimeType() == 'application/pdf'
+    copy.attachments[1].file.seek(0)
+    assert copy.attachments[1].file.read() == b'first line\nsecond line\n'
+
+
+def test_without_bodies(tmp_path):
+    email = makeEmail(tmp_path)
+    copy = Email.from_store(email.to_store(), bodies=False)
+    assertSameHeaders(copy, email)
+    assert copy.plain_text is None
+    assert copy.html is None
+    assertSameAttachments(copy, email)
+
+
+def test_empty_email(tmp_path):
+    email = Email()
+    email.sender = Addressee('Billing', 'billing@example.com')
+    email.subject = ''
+    copy = Email.from_store(email.to_store())
+    assert (copy.sender.email, copy.subject, copy.attachments, copy.reciever) == \
+        ('billing@example.com', '', [], [])
+
+
+@pytest.mark.parametrize('data', [b'', b'PSTLMSG', b'not a store file at all', b'PK\x03\x04' + bytes(40)])
+def test_bad_magic_raises(tmp_path, data):
+    with pytest.raises(ValueError):
+        Email.from_store(data)
+    path = tmp_path / 'bad.store'
+    path.write_bytes(data)
+    with pytest.raises(ValueError):
+        Email.from_store(str(path))
+
+
+def test_readSendFormat_keeps_cc_and_bcc_apart(tmp_path):
+    email = makeEmail(tmp_path)
+    copy = Email()
+    copy.readSendFormat(email.makeEmail())
+    assert people(copy.reciever) == people(email.reciever)
+    assert people(copy.cc) == [('Copy', 'copy@example.net')]
+    assert people(copy.bcc) == [('Hidden', 'hidden@example.net')]
@@ -0,0 +1,134 @@
+"""
+Email.import_stream, the incremental webhook parser, checked against Email.importEmail.
+
+Run from the app directory: python -m pytest tests
+"""
+
+import base64
+import io
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from postalclient.main import Email
+
+CHUNK_SIZES = (1, 7, 4096)
+
+ATTACHMENT = b'%PDF-1.4\n' + bytes(range(256)) * 40
+
+
+class Trickle(io.RawIOBase):
+    """Binary file returning at most size bytes per read, like a slow socket"""
+
+    def __init__(self, data: bytes, size: int):
+        self.data = data
+        self.pos = 0
+        self.size = size
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        size = self.size if size is None or size < 0 else min(size, self.size)
+        chunk = self.data[self.pos:self.pos + size]
+        self.pos += len(chunk)
+        return chunk
+
+
+def makePayload(attachments=(), **fields):
+    data = {
+        "id": 7,
+        "rcpt_to": "support@example.com",
+        "mail_from": "billing@example.com",
+        "from": "Billing Team <billing@example.com>",
+        "to": "Support <support@example.com>, \"Doe, John\" <john@example.org>",
+        "cc": "Copy <copy@example.net>",
+        "date": "Mon, 1 Jan 2024 10:00:00 +0000",
+        "subject": "Rechnung Nr. 7 – Grüße \U0001F4E7",
+        "plain_body": "Hello\nWorld \"quoted\" \\ backslash",
+        "html_body": "<p>Hello</p>",
+        "attachment_quantity": len(attachments or ()),
+        "attachments": None if attachments is None else [
+            {"filename": name, "content_type": "application/pdf", "data": base64.b64encode(data).decode('ascii')}
+            for name, data in attachments],
+    }
+    data.update(fields)
+    return json.dumps(data)
+
+
+def summary(email):
+    """Fields of an imported email, with attachments decoded"""
+    return {
+        'sender': (email.sender.name, email.sender.email),
+        'to': [(person.name, person.email) for person in email.reciever],
+        'cc': [(person.name, person.email) for person in email.cc],
+        'subject': email.subject,
+        'plain_text': email.plain_text,
+        'html': email.html,
+        'extra': email.extra,
+        'attachments': [(attachment.name, attachment.ext, base64.b64decode(attachment.data))
+                        for attachment in email.attachments],
+    }
+
+
+def importBoth(payload: str, size: int):
+    expected = Email()
+    expected.importEmail(payload)
+    streamed = Email()
+    streamed.import_stream(Trickle(payload.encode('utf-8'), size), chunk_size=size)
+    return summary(expected), summary(streamed)
+
+
+@pytest.mark.parametrize('size', CHUNK_SIZES)
+def test_matches_importEmail(size):
+    payload = makePayload([("invoice.pdf", ATTACHMENT), ("empty.txt", b""), ("notes.txt", b"a")])
+    expected, streamed = importBoth(payload, size)
+    assert streamed == expected
+    assert streamed['attachments'][0][2] == ATTACHMENT
+
+
+@pytest.mark.parametrize('size', CHUNK_SIZES)
+def test_escaped_slashes_in_data(size):
+    data = b'\xff\xfe\xfd' * 500
+    assert b'/' in base64.b64encode(data)
+    payload = makePayload([("scan.pdf", data)]).replace('/', '\\/')
+    expected, streamed = importBoth(payload, size)
+    assert streamed == expected
+    assert streamed['attachments'][0][2] == data
+
+
+@pytest.mark.parametrize('size', CHUNK_SIZES)
+def test_null_and_empty_attachments(size):
+    for attachments in (None, []):
+        expected, streamed = importBoth(makePayload(attachments=attachments), size)
+        assert streamed == expected
+        assert streamed['attachments'] == []
+
+
+@pytest.mark.parametrize('size', CHUNK_SIZES)
+def test_empty_objects_and_unknown_fields(size):
+    payload = makePayload([("a.pdf", ATTACHMENT[:100])], flags={}, headers={"x": {}, "y": []}, spam=None)
+    expected, streamed = importBoth(payload, size)
+    assert streamed == expected
+
+
+@pytest.mark.parametrize('size', CHUNK_SIZES)
+def test_empty_payload_raises_like_importEmail(size):
+    with pytest.raises(KeyError):
+        Email().importEmail('{}')
+    with pytest.raises(KeyError):
+        Email().import_stream(Trickle(b'{}', size), chunk_size=size)
+
+
+@pytest.mark.parametrize('size', CHUNK_SIZES)
+def test_truncated_payload_raises(size):
+    payload = makePayload([("invoice.pdf", ATTACHMENT)]).encode('utf-8')
+    for cut in (1, 20, len(payload) // 2, len(payload) - 3, len(payload) - 1):
+        with pytest.raises(ValueError):
+            Email().importEmail(payload[:cut].decode('utf-8', 'ignore'))
+        with pytest.raises(ValueError):
+            Email().import_stream(Trickle(payload[:cut], size), chunk_size=size)